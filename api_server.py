@@ -4,44 +4,98 @@ HTTP API сервер для интеграции с Make.com
 """
 import asyncio
 import logging
-from fastapi import FastAPI, HTTPException, Header
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+import multiprocessing
+import sys
+import time
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict
 from typing import Optional
 import uvicorn
 
 from config import config
 from generators import generate_complete_post
-from models import add_post, mark_post_published, get_unpublished_posts
+from models import (
+    add_post, mark_post_published, get_post_by_id,
+    get_unpublished_posts_cached, get_unpublished_posts_summary
+)
 from scheduler import publish_post_to_telegram
-from bot import bot, dp
+from state import pop_make_topic
+from bot import bot, dp, main as bot_main
 from aiogram.types import Update
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="SMM Travel Bot API", version="1.0.0")
+# orjson сериализует dict/datetime в Rust, без jsonable_encoder + json.dumps
+app = FastAPI(title="SMM Travel Bot API", version="1.0.0",
+              default_response_class=ORJSONResponse)
+
+# Лимиты размера тела запроса (байт): отклоняем слишком большие payload
+# по заголовку Content-Length до того, как тело будет прочитано и распарсено
+MAX_BODY_SIZE_DEFAULT = 65_536  # 64KB - webhook и прочие endpoints
+MAX_BODY_SIZE_CONTENT = 1_000_000  # 1MB - /api/publish_content (текст + URL)
+
+
+@app.middleware("http")
+async def limit_body_size(request: Request, call_next):
+    """Отклонение слишком больших запросов до чтения тела"""
+    content_length = request.headers.get("content-length")
+    if content_length:
+        limit = MAX_BODY_SIZE_CONTENT if request.url.path == "/api/publish_content" else MAX_BODY_SIZE_DEFAULT
+        try:
+            if int(content_length) > limit:
+                logger.warning("⚠️ Отклонен слишком большой запрос: %s байт на %s", content_length, request.url.path)
+                return ORJSONResponse({"error": "payload too large"}, status_code=413)
+        except ValueError:
+            pass
+    return await call_next(request)
+
+# uvloop/httptools ставятся только вне Windows (см. requirements.txt) -
+# на win32 откатываемся на стандартные реализации, как делает bot.py
+_UVICORN_LOOP = "uvloop" if sys.platform != "win32" else "asyncio"
+_UVICORN_HTTP = "httptools" if sys.platform != "win32" else "auto"
 
 # Простой API ключ для безопасности (можно задать в .env)
 API_KEY = config.OPENAI_API_KEY[:10] if config.OPENAI_API_KEY else "default_key_12345"
 
+# Константы webhook вычисляем один раз при импорте, чтобы не ходить
+# в атрибуты config на каждый запрос
+WEBHOOK_ROUTE = config.WEBHOOK_PATH if config.WEBHOOK_PATH and config.USE_WEBHOOK else "/webhook/telegram"
+WEBHOOK_SECRET = config.WEBHOOK_SECRET
+
+
+# Коалесценция одновременных одинаковых запросов генерации:
+# Make.com при ретраях может отправить один и тот же запрос дважды,
+# а каждая генерация - это платный вызов OpenAI на несколько секунд,
+# плюс запись в БД и (опционально) публикация в Telegram.
+# Повторный запрос с теми же параметрами ждет уже запущенный конвейер
+# целиком - иначе ретрай вставил бы вторую строку и запостил дубль.
+_inflight_generations: dict = {}
+
 
 class GenerateRequest(BaseModel):
     """Модель запроса на генерацию поста"""
+    # extra='ignore' - не ведем учет лишних полей (включая старый api_key,
+    # который никогда не проверялся); frozen=True - без __setattr__ bookkeeping
+    model_config = ConfigDict(extra='ignore', frozen=True)
+
     topic: Optional[str] = None
     publish: bool = True  # Автоматически публиковать после генерации
-    api_key: Optional[str] = None  # Опциональный API ключ для безопасности
 
 
 class PublishRequest(BaseModel):
     """Модель запроса на публикацию"""
+    model_config = ConfigDict(extra='ignore', frozen=True)
+
     post_id: Optional[int] = None  # ID поста для публикации, если None - последний неопубликованный
-    api_key: Optional[str] = None
 
 
 class PublishContentRequest(BaseModel):
     """Модель запроса на публикацию готового контента от Make.com"""
+    model_config = ConfigDict(extra='ignore', frozen=True)
+
     content: str  # Текст поста
     image_url: Optional[str] = None  # URL изображения (опционально)
     topic: Optional[str] = None  # Тема поста (для сохранения в БД, опционально)
@@ -72,7 +126,7 @@ async def status():
     return {
         "status": "online",
         "bot_connected": True,
-        "timestamp": asyncio.get_event_loop().time()
+        "timestamp": time.monotonic()
     }
 
 
@@ -85,42 +139,64 @@ async def generate_post(request: GenerateRequest):
     Body:
     - topic (optional): Тема поста
     - publish (optional, default=True): Автоматически публиковать после генерации
-    - api_key (optional): API ключ для безопасности
     """
     try:
-        logger.info(f"📥 Получен запрос на генерацию поста. Тема: {request.topic}")
-        
-        # Генерация поста
-        post_data = generate_complete_post(topic=request.topic)
-        
-        # Сохранение в БД
-        post = add_post(
-            topic=post_data.get('topic', request.topic or 'Случайная тема'),
-            content=post_data['content'],
-            image_url=post_data.get('image_url'),
-            image_prompt=post_data.get('image_prompt')
-        )
-        
-        logger.info(f"✅ Пост сгенерирован. ID: {post.id}, Тема: {post.topic}")
-        
-        # Если нужно опубликовать
-        message_id = None
-        if request.publish:
+        logger.info("📥 Получен запрос на генерацию поста. Тема: %s", request.topic)
+
+        # Весь конвейер (генерация -> сохранение -> публикация) под одним
+        # single-flight ключом: коалесцированный ретрай получает тот же
+        # пост и тот же message_id, а не вторую строку в БД и дубль в группе
+        key = (request.topic or "__random__", request.publish)
+        inflight = _inflight_generations.get(key)
+        if inflight is not None:
+            logger.info("⏳ Такой же запрос уже выполняется, жду результат: %s", key)
+            post_data, post, message_id = await inflight
+        else:
+            future = asyncio.get_running_loop().create_future()
+            _inflight_generations[key] = future
             try:
-                message_id = await publish_post_to_telegram(bot, post_data)
-                if message_id:
-                    mark_post_published(post.id, message_id)
-                    logger.info(f"✅ Пост опубликован. Telegram ID: {message_id}")
+                # Синхронные вызовы OpenAI и БД - в отдельный поток,
+                # чтобы не блокировать event loop на секунды
+                post_data = await asyncio.to_thread(generate_complete_post, topic=request.topic)
+
+                post = await asyncio.to_thread(
+                    add_post,
+                    topic=post_data.get('topic', request.topic or 'Случайная тема'),
+                    content=post_data['content'],
+                    image_url=post_data.get('image_url'),
+                    image_prompt=post_data.get('image_prompt')
+                )
+                logger.info("✅ Пост сгенерирован. ID: %s, Тема: %s", post.id, post.topic)
+
+                # Если нужно опубликовать
+                message_id = None
+                if request.publish:
+                    try:
+                        message_id = await publish_post_to_telegram(bot, post_data)
+                        if message_id:
+                            await asyncio.to_thread(mark_post_published, post.id, message_id)
+                            logger.info("✅ Пост опубликован. Telegram ID: %s", message_id)
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка публикации: {e}")
+                        # Не возвращаем ошибку, если генерация прошла успешно
+
+                future.set_result((post_data, post, message_id))
             except Exception as e:
-                logger.error(f"❌ Ошибка публикации: {e}")
-                # Не возвращаем ошибку, если генерация прошла успешно
-        
+                future.set_exception(e)
+                future.exception()  # помечаем исключение как полученное
+                raise
+            finally:
+                _inflight_generations.pop(key, None)
+
+        content = post_data['content']
+        image_url = post_data.get('image_url')
+
         return {
             "success": True,
             "post_id": post.id,
             "topic": post.topic,
-            "content_preview": post_data['content'][:200] + "..." if len(post_data['content']) > 200 else post_data['content'],
-            "has_image": bool(post_data.get('image_url')),
+            "content_preview": content[:200] + ("..." if len(content) > 200 else ""),
+            "has_image": bool(image_url),
             "published": bool(message_id),
             "telegram_message_id": message_id
         }
@@ -134,46 +210,41 @@ async def generate_post(request: GenerateRequest):
 async def publish_post(request: PublishRequest):
     """
     Публикация существующего поста
-    
+
     Body:
     - post_id (optional): ID поста для публикации, если None - последний неопубликованный
-    - api_key (optional): API ключ для безопасности
     """
     try:
-        from models import Post, SessionLocal
-        
-        db = SessionLocal()
-        try:
-            if request.post_id:
-                post = db.query(Post).filter(Post.id == request.post_id).first()
-                if not post:
-                    raise HTTPException(status_code=404, detail=f"Пост с ID {request.post_id} не найден")
-            else:
-                unpublished = get_unpublished_posts()
-                if not unpublished:
-                    raise HTTPException(status_code=404, detail="Нет неопубликованных постов")
-                post = unpublished[0]
-            
-            post_data = {
-                'content': post.content,
-                'image_url': post.image_url if post.image_url else None
+        if request.post_id:
+            # SELECT в поток, как и остальные обращения к БД в этом
+            # файле - под write-lock SQLite он может подвесить event loop
+            post = await asyncio.to_thread(get_post_by_id, request.post_id)
+            if not post:
+                raise HTTPException(status_code=404, detail=f"Пост с ID {request.post_id} не найден")
+        else:
+            # Кэш можно использовать только когда post_id не указан
+            unpublished = await asyncio.to_thread(get_unpublished_posts_cached)
+            if not unpublished:
+                raise HTTPException(status_code=404, detail="Нет неопубликованных постов")
+            post = unpublished[0]
+
+        post_data = {
+            'content': post.content,
+            'image_url': post.image_url if post.image_url else None
+        }
+
+        message_id = await publish_post_to_telegram(bot, post_data)
+
+        if message_id:
+            await asyncio.to_thread(mark_post_published, post.id, message_id)
+            return {
+                "success": True,
+                "post_id": post.id,
+                "telegram_message_id": message_id
             }
-            
-            message_id = await publish_post_to_telegram(bot, post_data)
-            
-            if message_id:
-                mark_post_published(post.id, message_id)
-                return {
-                    "success": True,
-                    "post_id": post.id,
-                    "telegram_message_id": message_id
-                }
-            else:
-                raise HTTPException(status_code=500, detail="Ошибка публикации в Telegram")
-                
-        finally:
-            db.close()
-            
+        else:
+            raise HTTPException(status_code=500, detail="Ошибка публикации в Telegram")
+
     except HTTPException:
         raise
     except Exception as e:
@@ -194,10 +265,10 @@ async def publish_content(request: PublishContentRequest):
     - save_to_db (optional, default=False): Сохранять ли пост в базу данных
     """
     try:
-        logger.info(f"📥 Получен запрос на публикацию контента от Make.com")
-        logger.info(f"📝 Длина контента: {len(request.content)} символов")
-        logger.info(f"🖼️ Изображение: {'Да' if request.image_url else 'Нет'}")
-        logger.info(f"💾 Сохранить в БД: {request.save_to_db}")
+        logger.info("📥 Получен запрос на публикацию контента от Make.com")
+        logger.info("📝 Длина контента: %d символов", len(request.content))
+        logger.info("🖼️ Изображение: %s", 'Да' if request.image_url else 'Нет')
+        logger.info("💾 Сохранить в БД: %s", request.save_to_db)
         
         # Формируем данные для публикации
         post_data = {
@@ -220,20 +291,21 @@ async def publish_content(request: PublishContentRequest):
         # Если нужно сохранить в БД
         if request.save_to_db:
             try:
-                post = add_post(
+                post = await asyncio.to_thread(
+                    add_post,
                     topic=request.topic or "Пост от Make.com",
                     content=request.content,
                     image_url=request.image_url,
                     image_prompt=None
                 )
-                mark_post_published(post.id, message_id)
+                await asyncio.to_thread(mark_post_published, post.id, message_id)
                 result["post_id"] = post.id
-                logger.info(f"✅ Пост сохранен в БД с ID: {post.id}")
+                logger.info("✅ Пост сохранен в БД с ID: %s", post.id)
             except Exception as e:
-                logger.warning(f"⚠️ Не удалось сохранить в БД: {e}")
+                logger.warning("⚠️ Не удалось сохранить в БД: %s", e)
                 # Не возвращаем ошибку, так как публикация прошла успешно
         
-        logger.info(f"✅ Контент успешно опубликован. Telegram ID: {message_id}")
+        logger.info("✅ Контент успешно опубликован. Telegram ID: %s", message_id)
         return result
         
     except HTTPException:
@@ -247,18 +319,19 @@ async def publish_content(request: PublishContentRequest):
 async def get_unpublished():
     """Получить список неопубликованных постов"""
     try:
-        unpublished = get_unpublished_posts()
+        # Проекция только нужных колонок - без загрузки content/image_prompt
+        rows = await asyncio.to_thread(get_unpublished_posts_summary, 10)
         return {
             "success": True,
-            "count": len(unpublished),
+            "count": len(rows),
             "posts": [
                 {
-                    "id": post.id,
-                    "topic": post.topic,
-                    "created_at": post.created_at.isoformat(),
-                    "has_image": bool(post.image_url)
+                    "id": row.id,
+                    "topic": row.topic,
+                    "created_at": row.created_at,  # orjson сериализует datetime сам
+                    "has_image": bool(row.image_url)
                 }
-                for post in unpublished[:10]  # Первые 10
+                for row in rows
             ]
         }
     except Exception as e:
@@ -266,23 +339,26 @@ async def get_unpublished():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post(config.WEBHOOK_PATH if config.WEBHOOK_PATH and config.USE_WEBHOOK else "/webhook/telegram")
-async def telegram_webhook(request: dict, x_telegram_bot_api_secret_token: Optional[str] = Header(None)):
+@app.post(WEBHOOK_ROUTE)
+async def telegram_webhook(request: Request, x_telegram_bot_api_secret_token: Optional[str] = Header(None)):
     """
     Endpoint для приема webhook от Telegram
     Используется вместо polling для совместимости с Make.com
     """
+    # Проверка секретного токена (если настроен) - до чтения тела,
+    # чтобы не тратить время на парсинг чужих запросов
+    if WEBHOOK_SECRET:
+        if x_telegram_bot_api_secret_token != WEBHOOK_SECRET:
+            logger.warning("❌ Неверный секретный токен webhook")
+            raise HTTPException(status_code=403, detail="Invalid secret token")
+
     try:
-        # Проверка секретного токена (если настроен)
-        if config.WEBHOOK_SECRET:
-            if x_telegram_bot_api_secret_token != config.WEBHOOK_SECRET:
-                logger.warning("❌ Неверный секретный токен webhook")
-                raise HTTPException(status_code=403, detail="Invalid secret token")
-        
-        logger.debug(f"📥 Получен webhook от Telegram: {request}")
-        
-        # Создаем Update объект из данных webhook
-        update = Update(**request)
+        # Парсим JSON сразу в Update через pydantic-core,
+        # без промежуточного dict и распаковки через **
+        raw = await request.body()
+        logger.debug("📥 Получен webhook от Telegram: %d байт", len(raw))
+
+        update = Update.model_validate_json(raw)
         
         # Обрабатываем обновление через диспетчер
         await dp.feed_update(bot, update)
@@ -300,41 +376,27 @@ async def telegram_webhook(request: dict, x_telegram_bot_api_secret_token: Optio
 async def get_make_topic():
     """
     Получить сохраненную тему от бота (для Make)
-    Тема сохраняется командой /make_topic в боте
-    Файл удаляется после первого чтения (одноразовое использование)
+    Тема сохраняется ботом через state.set_make_topic
+    Тема удаляется из очереди после первого чтения (одноразовое использование)
     """
-    import json
-    import os
-    
-    # Получаем абсолютный путь к файлу
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    topic_file = os.path.join(base_dir, "make_topic_request.json")
-    
-    try:
-        if os.path.exists(topic_file):
-            with open(topic_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                topic = data.get("topic", "Не указана")
-                # Удаляем файл после прочтения (чтобы тема использовалась один раз)
-                os.remove(topic_file)
-                logger.info(f"📥 Make получил тему через API: {topic}")
-                return data
-        else:
-            logger.debug("📭 Запрос темы через API, но тема не задана")
-            return {"topic": None, "message": "Тема не задана"}
-    except Exception as e:
-        logger.error(f"❌ Ошибка чтения темы: {e}", exc_info=True)
-        return {"topic": None, "error": str(e)}
+    data = pop_make_topic()
+    if data:
+        logger.info("📥 Make получил тему через API: %s", data.get('topic'))
+        return data
+
+    logger.debug("📭 Запрос темы через API, но тема не задана")
+    return {"topic": None, "message": "Тема не задана"}
 
 
 async def run_bot():
     """Запуск Telegram бота с автоматическим перезапуском при ошибках"""
-    from bot import main as bot_main
-    
     while True:
         try:
             logger.info("🤖 Запуск Telegram бота...")
-            await bot_main()
+            # serve_webhook=False: webhook-обновления принимает endpoint
+            # этого API-сервера; собственный aiohttp-сервер бота на том же
+            # API_HOST:API_PORT устроил бы гонку за порт с uvicorn
+            await bot_main(serve_webhook=False)
         except Exception as e:
             logger.error(f"❌ Ошибка в работе бота: {e}", exc_info=True)
             logger.info("🔄 Перезапуск бота через 10 секунд...")
@@ -346,44 +408,92 @@ async def run_api_server(host=None, port=None):
     host = host or config.API_HOST
     port = port or config.API_PORT
     logger.info(f"🚀 Запуск API сервера на {host}:{port}")
-    uvicorn_config = uvicorn.Config(app, host=host, port=port, log_level="info")
+    # uvloop + httptools заметно быстрее дефолтных selector loop + h11
+    # для множества мелких POST от Telegram/Make; access_log отключаем,
+    # т.к. форматирование строки лога на каждый запрос - синхронная работа
+    uvicorn_config = uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        log_level="info",
+        loop=_UVICORN_LOOP,
+        http=_UVICORN_HTTP,
+        access_log=False,
+        timeout_keep_alive=30,
+        backlog=2048
+    )
     server = uvicorn.Server(uvicorn_config)
     await server.serve()
 
 
+# Максимум запусков пары бот+API в run_both: постоянная ошибка
+# (битый токен, занятый порт) не должна маскироваться вечным циклом
+_MAX_RUN_ATTEMPTS = 3
+
+
 async def run_both():
-    """Запуск бота и API сервера одновременно"""
+    """Запуск бота и API сервера одновременно
+
+    Если оба сервиса завершились (gather возвращается только когда
+    закончились оба), запускаем их заново - но не более
+    _MAX_RUN_ATTEMPTS раз, чтобы не крутить бесконечный цикл поверх
+    постоянной ошибки. KeyboardInterrupt пробрасывается наверх.
+    """
     logger.info("🚀 Запуск бота и API сервера...")
-    
-    # Запускаем оба сервиса параллельно
-    # Если один упадет, другой продолжит работать
-    try:
+
+    # Перезапуск в цикле, а не рекурсией: при повторяющихся сбоях
+    # рекурсивный вызов рос бы стеком с каждой попыткой
+    for attempt in range(1, _MAX_RUN_ATTEMPTS + 1):
+        # Запускаем оба сервиса параллельно
+        # (return_exceptions - ошибка одного не отменяет другой)
         results = await asyncio.gather(
             run_bot(),
             run_api_server(),
-            return_exceptions=True  # Не останавливать другие задачи при ошибке
+            return_exceptions=True
         )
-        
+
         # Проверяем результаты
-        for i, result in enumerate(results):
+        for name, result in zip(("боте", "API сервере"), results):
             if isinstance(result, Exception):
-                if i == 0:
-                    logger.error(f"❌ Критическая ошибка в боте: {result}", exc_info=True)
-                else:
-                    logger.error(f"❌ Критическая ошибка в API сервере: {result}", exc_info=True)
-                    
-        logger.warning("⚠️ Оба сервиса завершились. Завершение программы.")
-        
-    except KeyboardInterrupt:
-        logger.info("⏸️ Получен сигнал остановки...")
-        raise
-    except Exception as e:
-        logger.error(f"❌ Критическая ошибка в run_both: {e}", exc_info=True)
-        # Пытаемся перезапустить через 30 секунд
-        logger.info("🔄 Попытка перезапуска через 30 секунд...")
-        await asyncio.sleep(30)
-        # Рекурсивный вызов (будет перезапущено systemd)
-        await run_both()
+                logger.error(f"❌ Критическая ошибка в {name}: {result}", exc_info=result)
+
+        if attempt < _MAX_RUN_ATTEMPTS:
+            logger.info("🔄 Перезапуск сервисов (попытка %d из %d) через 30 секунд...",
+                        attempt + 1, _MAX_RUN_ATTEMPTS)
+            await asyncio.sleep(30)
+
+    logger.warning("⚠️ Исчерпан лимит перезапусков (%d). Завершение программы.", _MAX_RUN_ATTEMPTS)
+
+
+def _bot_process_main():
+    """Точка входа процесса бота (на уровне модуля, чтобы работал pickle)"""
+    asyncio.run(run_bot())
+
+
+def run_separate_processes():
+    """Запуск бота и API сервера в отдельных процессах
+
+    Каждый сервис получает свой GIL и свой event loop: CPU-нагрузка
+    в обработчиках бота не тормозит HTTP и наоборот.
+    Требует SEPARATE_PROCESSES=true; в этом режиме недоступны
+    in-process механизмы (очередь make_topic, webhook через API).
+    """
+    logger.info("🚀 Запуск бота и API сервера в отдельных процессах...")
+    # spawn вместо fork: дочерний процесс импортирует модули заново
+    # и не наследует ни открытый файловый дескриптор SQLite из пула
+    # соединений (SQLite запрещает использовать соединение по обе
+    # стороны fork - риск порчи БД), ни мертвый после fork поток
+    # QueueListener логирования из bot.py
+    ctx = multiprocessing.get_context("spawn")
+    bot_process = ctx.Process(target=_bot_process_main, name="telegram-bot")
+    bot_process.start()
+    logger.info(f"🤖 Процесс бота запущен (PID: {bot_process.pid})")
+    try:
+        asyncio.run(run_api_server())
+    finally:
+        logger.info("🛑 Остановка процесса бота...")
+        bot_process.terminate()
+        bot_process.join(timeout=10)
 
 
 def run_api_server_only(host=None, port=None):
@@ -391,13 +501,16 @@ def run_api_server_only(host=None, port=None):
     host = host or config.API_HOST
     port = port or config.API_PORT
     logger.info(f"🚀 Запуск API сервера на {host}:{port}")
-    uvicorn.run(app, host=host, port=port)
+    uvicorn.run(app, host=host, port=port, loop=_UVICORN_LOOP, http=_UVICORN_HTTP)
 
 
 if __name__ == "__main__":
     # Запускаем и бота, и API сервер одновременно
     try:
-        asyncio.run(run_both())
+        if config.SEPARATE_PROCESSES:
+            run_separate_processes()
+        else:
+            asyncio.run(run_both())
     except KeyboardInterrupt:
         logger.info("⏸️ Остановка сервисов...")
 
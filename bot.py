@@ -10,19 +10,35 @@ if sys.platform == 'win32':
 
 import asyncio
 import logging
+import re
+import orjson
 from datetime import datetime
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+
+# На Linux используем uvloop - C-реализация event loop на libuv заметно
+# быстрее стандартного селекторного цикла asyncio
+if sys.platform != 'win32':
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
+from aiogram import Bot, Dispatcher, Router, types, F
+from aiogram.filters import Command, CommandObject, Filter
 from aiogram.types import Message, FSInputFile
 from aiogram.enums import ParseMode
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram import BaseMiddleware
 from typing import Callable, Dict, Any, Awaitable
 
 from config import config
 from models import (
-    init_db, add_post, get_unpublished_posts, 
-    mark_post_published, get_active_schedule, Schedule, SessionLocal,
-    fix_null_is_published, get_posts_diagnostic
+    init_db, add_post, get_unpublished_posts,
+    get_unpublished_posts_summary,
+    mark_post_published, get_active_schedule,
+    get_posts_diagnostic,
+    get_recent_posts, get_post_by_id, upsert_active_schedule,
+    fix_recently_marked_published
 )
 from generators import (
     generate_complete_post, download_image,
@@ -41,19 +57,41 @@ from pathlib import Path
 log_dir = Path("logs")
 log_dir.mkdir(exist_ok=True)
 
-# Настройка логирования в файл и консоль
+# Настройка логирования в файл и консоль.
+# Запись идет через QueueHandler/QueueListener: блокирующий write()
+# в файл выполняется в отдельном потоке, а не в event loop бота
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_file_handler = logging.FileHandler(log_dir / 'bot.log', encoding='utf-8')
+_file_handler.setFormatter(_log_formatter)
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(_log_formatter)
+
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_dir / 'bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+    handlers=[QueueHandler(_log_queue)]
 )
+_log_listener = QueueListener(_log_queue, _file_handler, _stream_handler)
+_log_listener.start()
+
 logger = logging.getLogger(__name__)
 
-# Инициализация бота и диспетчера
-bot = Bot(token=config.TELEGRAM_BOT_TOKEN)
+def _orjson_dumps(obj) -> str:
+    """Сериализация через orjson (возвращает str, как ждет aiogram)"""
+    return orjson.dumps(obj).decode()
+
+
+# Инициализация бота и диспетчера.
+# Явная aiohttp-сессия: один пул keep-alive соединений на все вызовы
+# Telegram API (без повторных TLS-рукопожатий); JSON-трафик Bot API
+# кодируется/декодируется через orjson вместо stdlib json
+bot = Bot(
+    token=config.TELEGRAM_BOT_TOKEN,
+    session=AiohttpSession(json_loads=orjson.loads, json_dumps=_orjson_dumps)
+)
 dp = Dispatcher()
 
 
@@ -65,32 +103,25 @@ class LoggingMiddleware(BaseMiddleware):
         event: Message,
         data: Dict[str, Any]
     ) -> Any:
-        user = event.from_user
-        logger.info(
-            f"📨 Сообщение от {user.id} (@{user.username or 'N/A'}) "
-            f"в чате {event.chat.id}: {event.text or '[медиа/стикер/другое]'}"
-        )
+        # Ленивые %s-аргументы: строка собирается только если INFO включен
+        if logger.isEnabledFor(logging.INFO):
+            user = event.from_user
+            logger.info(
+                "📨 Сообщение от %s (@%s) в чате %s: %s",
+                user.id, user.username or 'N/A', event.chat.id,
+                event.text or '[медиа/стикер/другое]'
+            )
         return await handler(event, data)
 
 # Регистрируем middleware
 dp.message.middleware(LoggingMiddleware())
 
 
-def is_admin(user_id: int) -> bool:
-    """Проверка, является ли пользователь администратором"""
-    return user_id == config.ADMIN_ID
-
-
-# ======================== ОБРАБОТЧИКИ КОМАНД ========================
+# Компилируем регулярку для кнопок /view_post_[ID] один раз при импорте
+_VIEW_POST_RE = re.compile(r'^/view_post_(\d+)$')
 
-@dp.message(Command("start"))
-async def cmd_start(message: Message):
-    """Обработчик команды /start"""
-    if not is_admin(message.from_user.id):
-        await message.answer("❌ У вас нет прав для использования этого бота.")
-        return
-    
-    welcome_text = """
+# Статические тексты собираем один раз при импорте, а не на каждый вызов
+_WELCOME_TEXT = """
 🌍 <b>Добро пожаловать в SMM-бота для блога о путешествиях!</b>
 
 Этот бот поможет вам автоматизировать создание и публикацию контента о путешествиях.
@@ -128,40 +159,182 @@ async def cmd_start(message: Message):
 
 Начните с команды /recommend для получения рекомендаций! ✨
 """
-    await message.answer(welcome_text, parse_mode=ParseMode.HTML)
 
+_DAYS_MAP = {
+    '0': 'Понедельник', '1': 'Вторник', '2': 'Среда', '3': 'Четверг',
+    '4': 'Пятница', '5': 'Суббота', '6': 'Воскресенье'
+}
+
+# Ответы fallback-обработчика: это самый горячий путь для чужого
+# трафика, поэтому строки собраны один раз при импорте
+_UNAUTH_CMD = (
+    "❌ У вас нет прав для использования этого бота.\n\n"
+    "Если вы администратор, проверьте, что ваш ID совпадает с ADMIN_ID в настройках.\n\n"
+    "Используйте команду /chatid для проверки вашего ID."
+)
+_UNKNOWN_CMD = (
+    "❓ Неизвестная команда.\n\n"
+    "Используйте /help для просмотра доступных команд."
+)
+_UNAUTH_MSG = (
+    "👋 Привет! Я бот для автоматизации SMM-контента о путешествиях.\n\n"
+    "❌ У вас нет прав для использования этого бота.\n\n"
+    "Если вы администратор, проверьте настройки ADMIN_ID.\n"
+    "Используйте /start для начала работы."
+)
+_ONLY_CMDS = (
+    "💬 Я понимаю только команды.\n\n"
+    "Используйте /help для просмотра доступных команд."
+)
+
+# frozenset - O(1) проверка прав и задел на нескольких админов
+ADMIN_IDS = frozenset({config.ADMIN_ID})
+
+
+def is_admin(user_id: int) -> bool:
+    """Проверка, является ли пользователь администратором"""
+    return user_id in ADMIN_IDS
+
+
+class IsAdmin(Filter):
+    """Фильтр доступа: пропускает только сообщения администратора"""
+
+    async def __call__(self, message: Message) -> bool:
+        return is_admin(message.from_user.id)
+
+
+# Роутер админских команд: проверка прав выполняется одним фильтром на
+# роутере, сообщения не от админа отбрасываются до вызова обработчика.
+# Роутер-fallback ловит все остальное и подключается последним
+admin_router = Router(name="admin")
+# Дешевый пре-фильтр: не-команды (обычный текст, медиа) не проходят
+# через цепочку Command-фильтров всех обработчиков, а сразу уходят
+# в fallback-роутер
+admin_router.message.filter(F.text.startswith("/"))
+admin_router.message.filter(IsAdmin())
+fallback_router = Router(name="fallback")
+
+dp.include_router(admin_router)
+dp.include_router(fallback_router)
+
+
+# Открывающие/закрывающие <b> и <i> для разбивки HTML-сообщений
+_HTML_TAG_RE = re.compile(r'<(/?)([bi])>')
+
+
+def _split_html_message(text: str, limit: int = 4000) -> list:
+    """Разбивка длинного HTML-сообщения на части для Telegram
 
-@dp.message(Command("help"))
+    Режем по последнему переводу строки перед лимитом, чтобы не разрезать
+    тег или слово посередине. Незакрытые <b>/<i> закрываются в конце части
+    (в порядке, обратном открытию - иначе получится <b><i>...</b></i> и
+    Telegram вернет "Can't parse entities") и заново открываются в начале
+    следующей.
+    """
+    # Быстрый путь: сообщение помещается целиком - без срезов
+    # и подсчета тегов
+    if len(text) <= limit:
+        return [text]
+
+    parts = []
+    carry = []  # теги, открытые в предыдущей части (в порядке открытия)
+    while text:
+        prefix = ''.join(f'<{tag}>' for tag in carry)
+        budget = limit - len(prefix) - 8  # запас на закрывающие теги
+        if len(text) <= budget:
+            chunk, text = text, ''
+        else:
+            cut = text.rfind('\n', 0, budget)
+            if cut <= 0:
+                cut = budget
+            chunk, text = text[:cut], text[cut:].lstrip('\n')
+
+        chunk = prefix + chunk
+        # Стек открытых тегов: закрывающий снимает последний открытый
+        carry = []
+        for closing, tag in _HTML_TAG_RE.findall(chunk):
+            if closing:
+                if carry and carry[-1] == tag:
+                    carry.pop()
+            else:
+                carry.append(tag)
+        # Закрываем в обратном порядке открытия - вложенность сохраняется
+        chunk += ''.join(f'</{tag}>' for tag in reversed(carry))
+        parts.append(chunk)
+    return parts
+
+
+# Single-flight для генерации: параллельные вызовы с одним ключом
+# (два /generate подряд, /publish_now во время /generate) ждут общий
+# результат вместо повторного обращения к LLM и дублирующей записи в БД
+_gen_inflight: Dict[str, asyncio.Future] = {}
+
+
+async def _generate_and_store_post(topic: str = None, is_published: bool = False):
+    """Сгенерировать пост и сохранить его в БД с коалесцированием
+
+    Возвращает кортеж (post_data, post). Блокирующие вызовы OpenAI и БД
+    уводим в поток, чтобы бот продолжал обрабатывать другие сообщения
+    во время генерации.
+    """
+    key = topic or "__auto__"
+    existing = _gen_inflight.get(key)
+    if existing is not None:
+        logger.info("⏳ Генерация по ключу '%s' уже идет, жду результат", key)
+        return await existing
+
+    future = asyncio.get_running_loop().create_future()
+    _gen_inflight[key] = future
+    try:
+        if topic is None:
+            post_data = await asyncio.to_thread(generate_complete_post)
+        else:
+            post_data = await asyncio.to_thread(generate_complete_post, topic=topic)
+
+        post = await asyncio.to_thread(
+            add_post,
+            topic=post_data.get('topic', topic),
+            content=post_data['content'],
+            image_url=post_data['image_url'],
+            image_prompt=post_data['image_prompt'],
+            is_published=is_published
+        )
+        future.set_result((post_data, post))
+        return post_data, post
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # помечаем извлеченным, если никто не ждал
+        raise
+    finally:
+        _gen_inflight.pop(key, None)
+
+
+# ======================== ОБРАБОТЧИКИ КОМАНД ========================
+
+@admin_router.message(Command("start"))
+async def cmd_start(message: Message):
+    """Обработчик команды /start"""
+    
+    await message.answer(_WELCOME_TEXT, parse_mode=ParseMode.HTML)
+
+
+@admin_router.message(Command("help"))
 async def cmd_help(message: Message):
     """Обработчик команды /help"""
-    if not is_admin(message.from_user.id):
-        await message.answer("❌ У вас нет прав для использования этого бота.")
-        return
     
     await cmd_start(message)
 
 
-@dp.message(Command("generate"))
+@admin_router.message(Command("generate"))
 async def cmd_generate(message: Message):
     """Обработчик команды /generate - генерация нового поста"""
-    if not is_admin(message.from_user.id):
-        await message.answer("❌ У вас нет прав для использования этой команды.")
-        return
     
     status_msg = await message.answer("🔄 Генерирую пост... Это может занять до минуты.")
     
     try:
-        # Генерируем пост
-        post_data = generate_complete_post()
-        
-        # Сохраняем в БД (явно указываем is_published=False)
-        post = add_post(
-            topic=post_data['topic'],
-            content=post_data['content'],
-            image_url=post_data['image_url'],
-            image_prompt=post_data['image_prompt'],
-            is_published=False  # Явно указываем False для неопубликованных постов
-        )
+        # Генерируем и сохраняем пост (is_published=False);
+        # параллельные запуски коалесцируются
+        post_data, post = await _generate_and_store_post()
         logger.info(f"📝 Пост сохранен: ID={post.id}, is_published={post.is_published}")
         
         await status_msg.edit_text(f"✅ Пост сгенерирован и сохранен (ID: {post.id})\n\n"
@@ -181,36 +354,24 @@ async def cmd_generate(message: Message):
         await status_msg.edit_text(f"❌ Ошибка при генерации поста: {str(e)}")
 
 
-@dp.message(Command("generate_custom"))
-async def cmd_generate_custom(message: Message):
+@admin_router.message(Command("generate_custom"))
+async def cmd_generate_custom(message: Message, command: CommandObject):
     """Обработчик команды /generate_custom - генерация поста на заданную тему"""
-    if not is_admin(message.from_user.id):
-        return
-    
-    # Извлекаем тему из команды
-    parts = message.text.split(maxsplit=1)
-    if len(parts) < 2:
+
+    # Тему команды aiogram уже распарсил в command.args
+    if not command.args:
         await message.answer("❌ Укажите тему поста.\n\n"
                            "Пример: /generate_custom Лучшие пляжи Бали")
         return
-    
-    topic = parts[1]
+
+    topic = command.args
     status_msg = await message.answer(f"🔄 Генерирую пост на тему: <b>{topic}</b>",
                                      parse_mode=ParseMode.HTML)
     
     try:
-        # Генерируем пост с заданной темой
-        post_data = generate_complete_post(topic=topic)
-        
-        # Сохраняем в БД (явно указываем is_published=False)
-        post = add_post(
-            topic=topic,
-            content=post_data['content'],
-            image_url=post_data['image_url'],
-            image_prompt=post_data['image_prompt'],
-            is_published=False  # Явно указываем False для неопубликованных постов
-        )
-        
+        # Генерируем и сохраняем пост на заданную тему (is_published=False)
+        post_data, post = await _generate_and_store_post(topic)
+
         await status_msg.edit_text(f"✅ Пост сгенерирован (ID: {post.id})")
         
         # Показываем превью
@@ -227,16 +388,14 @@ async def cmd_generate_custom(message: Message):
 
 # ======================== РЕКОМЕНДАЦИИ ПО КОНТЕНТУ ========================
 
-@dp.message(Command("recommend"))
+@admin_router.message(Command("recommend"))
 async def cmd_recommend(message: Message):
     """Обработчик команды /recommend - получить рекомендации по контенту"""
-    if not is_admin(message.from_user.id):
-        return
     
     status_msg = await message.answer("💡 Генерирую рекомендации по контенту...")
     
     try:
-        result = generate_content_recommendations()
+        result = await asyncio.to_thread(generate_content_recommendations)
         
         if result['success']:
             header = f"📊 <b>РЕКОМЕНДАЦИИ ПО КОНТЕНТУ</b>\n"
@@ -252,27 +411,24 @@ async def cmd_recommend(message: Message):
         await status_msg.edit_text(f"❌ Ошибка: {str(e)}")
 
 
-@dp.message(Command("analyze"))
-async def cmd_analyze(message: Message):
+@admin_router.message(Command("analyze"))
+async def cmd_analyze(message: Message, command: CommandObject):
     """Обработчик команды /analyze - анализ идеи для поста"""
-    if not is_admin(message.from_user.id):
-        return
-    
-    # Извлекаем тему из команды
-    parts = message.text.split(maxsplit=1)
-    if len(parts) < 2:
+
+    # Идея команды aiogram уже распарсена в command.args
+    if not command.args:
         await message.answer(
             "❌ Укажите идею для анализа.\n\n"
             "Пример: /analyze Топ-10 мест для фотосессий в Париже"
         )
         return
-    
-    idea = parts[1]
+
+    idea = command.args
     status_msg = await message.answer(f"🔍 Анализирую идею: <b>{idea}</b>",
                                      parse_mode=ParseMode.HTML)
     
     try:
-        result = analyze_post_idea(idea)
+        result = await asyncio.to_thread(analyze_post_idea, idea)
         
         if result['success']:
             header = f"📊 <b>АНАЛИЗ ИДЕИ</b>\n"
@@ -290,14 +446,12 @@ async def cmd_analyze(message: Message):
         await status_msg.edit_text(f"❌ Ошибка: {str(e)}")
 
 
-@dp.message(Command("publish"))
+@admin_router.message(Command("publish"))
 async def cmd_publish(message: Message):
     """Обработчик команды /publish - публикация неопубликованного поста"""
-    if not is_admin(message.from_user.id):
-        return
     
-    # Получаем неопубликованные посты (отсортированные по дате, последние сначала)
-    unpublished = get_unpublished_posts()
+    # Нужен только последний неопубликованный пост - limit=1
+    unpublished = await asyncio.to_thread(get_unpublished_posts, 1)
     
     if not unpublished:
         await message.answer("❌ Нет неопубликованных постов.\n\n"
@@ -321,9 +475,9 @@ async def cmd_publish(message: Message):
         
         logger.info(f"Данные для публикации: content_length={len(post_data['content'])}, image_url={post_data['image_url']}")
         message_id = await publish_post_to_telegram(bot, post_data)
-        
+
         if message_id:
-            mark_post_published(post.id, message_id)
+            await asyncio.to_thread(mark_post_published, post.id, message_id)
             await status_msg.edit_text(f"✅ Пост успешно опубликован!\n\n"
                                       f"ID поста: {post.id}\n"
                                       f"ID сообщения: {message_id}")
@@ -335,31 +489,21 @@ async def cmd_publish(message: Message):
         await status_msg.edit_text(f"❌ Ошибка: {str(e)}")
 
 
-@dp.message(Command("publish_now"))
+@admin_router.message(Command("publish_now"))
 async def cmd_publish_now(message: Message):
     """Обработчик команды /publish_now - генерация и немедленная публикация"""
-    if not is_admin(message.from_user.id):
-        return
     
     status_msg = await message.answer("🔄 Генерирую и публикую пост...")
     
     try:
-        # Генерируем пост
-        post_data = generate_complete_post()
-        
-        # Сохраняем в БД
-        post = add_post(
-            topic=post_data['topic'],
-            content=post_data['content'],
-            image_url=post_data['image_url'],
-            image_prompt=post_data['image_prompt']
-        )
-        
+        # Генерируем и сохраняем пост; параллельные запуски коалесцируются
+        post_data, post = await _generate_and_store_post()
+
         # Публикуем
         message_id = await publish_post_to_telegram(bot, post_data)
-        
+
         if message_id:
-            mark_post_published(post.id, message_id)
+            await asyncio.to_thread(mark_post_published, post.id, message_id)
             await status_msg.edit_text(f"✅ Пост сгенерирован и опубликован!\n\n"
                                       f"<b>Тема:</b> {post_data['topic']}\n"
                                       f"ID поста: {post.id}",
@@ -372,14 +516,12 @@ async def cmd_publish_now(message: Message):
         await status_msg.edit_text(f"❌ Ошибка: {str(e)}")
 
 
-@dp.message(Command("schedule_status"))
+@admin_router.message(Command("schedule_status"))
 async def cmd_schedule_status(message: Message):
     """Показать текущее расписание"""
-    if not is_admin(message.from_user.id):
-        return
-    
-    schedule = get_active_schedule()
     
+    schedule = await asyncio.to_thread(get_active_schedule)
+
     if not schedule:
         await message.answer("📅 Активное расписание не настроено.\n\n"
                            "Используйте /schedule_daily или /schedule_weekly для настройки.")
@@ -393,121 +535,80 @@ async def cmd_schedule_status(message: Message):
 """
     
     if schedule.days_of_week:
-        days_map = {
-            '0': 'Понедельник', '1': 'Вторник', '2': 'Среда', '3': 'Четверг',
-            '4': 'Пятница', '5': 'Суббота', '6': 'Воскресенье'
-        }
-        days = [days_map.get(d, d) for d in schedule.days_of_week.split(',')]
+        days = [_DAYS_MAP.get(d, d) for d in schedule.days_of_week.split(',')]
         status_text += f"📆 Дни недели: {', '.join(days)}\n"
     
     status_text += f"""
 ✅ Активно: {'Да' if schedule.is_active else 'Нет'}
-🕒 Последний запуск: {schedule.last_run.strftime('%Y-%m-%d %H:%M') if schedule.last_run else 'Еще не было'}
+🕒 Последний запуск: {schedule.last_run.isoformat(sep=' ', timespec='minutes') if schedule.last_run else 'Еще не было'}
 """
     
     await message.answer(status_text, parse_mode=ParseMode.HTML)
 
 
-@dp.message(Command("schedule_daily"))
-async def cmd_schedule_daily(message: Message):
+async def _apply_schedule(time_str: str, frequency: str, days_str: str = None):
+    """Общий путь обновления расписания для /schedule_daily и /schedule_weekly
+
+    Формат времени проверяется одним вызовом strptime (C-валидация
+    вместо ручного разбора), затем расписание сохраняется в БД
+    и планировщик перенастраивается.
+    """
+    datetime.strptime(time_str, '%H:%M')  # ValueError при неверном формате
+    await asyncio.to_thread(upsert_active_schedule, frequency, time_str, days_str)
+    setup_scheduler(bot)
+
+
+@admin_router.message(Command("schedule_daily"))
+async def cmd_schedule_daily(message: Message, command: CommandObject):
     """Установить ежедневную публикацию"""
-    if not is_admin(message.from_user.id):
-        return
-    
-    parts = message.text.split()
-    if len(parts) < 2:
+
+    if not command.args:
         await message.answer("❌ Укажите время в формате HH:MM\n\n"
                            "Пример: /schedule_daily 10:00")
         return
-    
-    time_str = parts[1]
-    
-    # Проверка формата времени
+
+    time_str = command.args.split()[0]
+
     try:
-        hour, minute = map(int, time_str.split(':'))
-        if not (0 <= hour < 24 and 0 <= minute < 60):
-            raise ValueError
-    except:
+        await _apply_schedule(time_str, 'daily')
+    except ValueError:
         await message.answer("❌ Неверный формат времени. Используйте HH:MM (например, 10:00)")
         return
-    
-    # Обновляем расписание в БД
-    db = SessionLocal()
-    try:
-        schedule = db.query(Schedule).filter(Schedule.is_active == True).first()
-        
-        if schedule:
-            schedule.frequency = 'daily'
-            schedule.time = time_str
-            schedule.days_of_week = None
-        else:
-            schedule = Schedule(frequency='daily', time=time_str, is_active=True)
-            db.add(schedule)
-        
-        db.commit()
-        
-        # Перенастраиваем планировщик
-        setup_scheduler(bot)
-        
-        await message.answer(f"✅ Расписание обновлено!\n\n"
-                           f"Посты будут публиковаться ежедневно в {time_str}")
-        
     except Exception as e:
-        db.rollback()
         logger.error(f"Ошибка обновления расписания: {e}")
         await message.answer(f"❌ Ошибка: {str(e)}")
-    finally:
-        db.close()
+        return
+
+    await message.answer(f"✅ Расписание обновлено!\n\n"
+                       f"Посты будут публиковаться ежедневно в {time_str}")
 
 
-@dp.message(Command("schedule_weekly"))
-async def cmd_schedule_weekly(message: Message):
+@admin_router.message(Command("schedule_weekly"))
+async def cmd_schedule_weekly(message: Message, command: CommandObject):
     """Установить еженедельную публикацию"""
-    if not is_admin(message.from_user.id):
-        return
-    
-    parts = message.text.split()
-    if len(parts) < 3:
+
+    parts = command.args.split() if command.args else []
+    if len(parts) < 2:
         await message.answer("❌ Укажите время и дни недели\n\n"
                            "Пример: /schedule_weekly 10:00 0,2,4\n"
                            "где 0=ПН, 1=ВТ, 2=СР, 3=ЧТ, 4=ПТ, 5=СБ, 6=ВС")
         return
-    
-    time_str = parts[1]
-    days_str = parts[2]
-    
-    # Обновляем расписание
-    db = SessionLocal()
+
+    time_str = parts[0]
+    days_str = parts[1]
+
     try:
-        schedule = db.query(Schedule).filter(Schedule.is_active == True).first()
-        
-        if schedule:
-            schedule.frequency = 'weekly'
-            schedule.time = time_str
-            schedule.days_of_week = days_str
-        else:
-            schedule = Schedule(
-                frequency='weekly',
-                time=time_str,
-                days_of_week=days_str,
-                is_active=True
-            )
-            db.add(schedule)
-        
-        db.commit()
-        
-        # Перенастраиваем планировщик
-        setup_scheduler(bot)
-        
-        await message.answer(f"✅ Расписание обновлено!\n\n"
-                           f"Посты будут публиковаться по расписанию: {time_str}, дни: {days_str}")
-        
+        await _apply_schedule(time_str, 'weekly', days_str)
+    except ValueError:
+        await message.answer("❌ Неверный формат времени. Используйте HH:MM (например, 10:00)")
+        return
     except Exception as e:
-        db.rollback()
         logger.error(f"Ошибка: {e}")
         await message.answer(f"❌ Ошибка: {str(e)}")
-    finally:
-        db.close()
+        return
+
+    await message.answer(f"✅ Расписание обновлено!\n\n"
+                       f"Посты будут публиковаться по расписанию: {time_str}, дни: {days_str}")
 
 
 @dp.message(Command("chatid"))
@@ -535,11 +636,9 @@ async def cmd_chatid(message: Message):
     await message.answer(text, parse_mode=ParseMode.HTML)
 
 
-@dp.message(Command("schedule_start"))
+@admin_router.message(Command("schedule_start"))
 async def cmd_schedule_start(message: Message):
     """Запустить планировщик"""
-    if not is_admin(message.from_user.id):
-        return
     
     try:
         start_scheduler()
@@ -548,11 +647,9 @@ async def cmd_schedule_start(message: Message):
         await message.answer(f"❌ Ошибка: {str(e)}")
 
 
-@dp.message(Command("schedule_stop"))
+@admin_router.message(Command("schedule_stop"))
 async def cmd_schedule_stop(message: Message):
     """Остановить планировщик"""
-    if not is_admin(message.from_user.id):
-        return
     
     try:
         stop_scheduler()
@@ -561,30 +658,25 @@ async def cmd_schedule_stop(message: Message):
         await message.answer(f"❌ Ошибка: {str(e)}")
 
 
-@dp.message(Command("list_posts"))
+@admin_router.message(Command("list_posts"))
 async def cmd_list_posts(message: Message):
     """Показать список неопубликованных постов"""
-    if not is_admin(message.from_user.id):
-        return
-    
-    from models import Post
-    db = SessionLocal()
     
     try:
-        # Сначала исправляем NULL значения
-        fixed = fix_null_is_published()
-        if fixed > 0:
-            logger.info(f"✅ Исправлено {fixed} NULL значений при запросе списка постов")
-        
+        # NULL значения исправляются один раз при старте (init_db),
+        # поэтому листинг - чисто читающая команда без UPDATE
+
         # Получаем диагностику
-        diag = get_posts_diagnostic()
-        
-        # Получаем неопубликованные посты
-        unpublished = get_unpublished_posts()
-        
-        # Получаем все посты для справки
-        total = db.query(Post).count()
-        
+        diag = await asyncio.to_thread(get_posts_diagnostic)
+
+        # Для списка достаточно облегченной проекции (без текста поста):
+        # показываем максимум 10, общее количество берем из диагностики
+        unpublished = await asyncio.to_thread(get_unpublished_posts_summary, 10)
+        unpublished_total = diag['published_false'] + diag['published_null']
+
+        # Всего постов - уже есть в диагностике
+        total = diag['total']
+
         if not unpublished:
             # Показываем детальную информацию если нет неопубликованных
             text = f"""📭 <b>Нет неопубликованных постов</b>
@@ -595,192 +687,139 @@ async def cmd_list_posts(message: Message):
 • Не опубликовано: {diag['published_false']}
 • Со значением NULL: {diag['published_null']}
 
-{"✅ Исправлено NULL записей: " + str(fixed) if fixed > 0 else ""}
-
 💡 Используйте /generate для создания нового поста
 💡 Используйте /db_diagnostic для детальной диагностики"""
             
             await message.answer(text, parse_mode=ParseMode.HTML)
             return
         
-        text = f"📝 <b>Неопубликованные посты ({len(unpublished)}):</b>\n\n"
-        
-        for post in unpublished[:10]:  # Показываем первые 10
+        parts = [f"📝 <b>Неопубликованные посты ({unpublished_total}):</b>\n\n"]
+
+        for post in unpublished:  # Показываем первые 10
             status_info = ""
             if post.is_published is None:
                 status_info = " (было NULL, исправлено)"
-            
-            text += f"📌 <b>ID: {post.id}</b>{status_info}\n"
-            text += f"🏷️ Тема: {post.topic}\n"
-            text += f"📅 Создан: {post.created_at.strftime('%Y-%m-%d %H:%M')}\n"
-            text += f"🖼️ Изображение: {'✅' if post.image_url else '❌'}\n"
-            text += f"👁️ Просмотр: /view_post_{post.id}\n\n"
-        
-        if len(unpublished) > 10:
-            text += f"\n... и еще {len(unpublished) - 10} постов\n"
-        
-        text += "\n💡 Используйте /view_post_[ID] для просмотра полного текста поста"
-        
-        await message.answer(text, parse_mode=ParseMode.HTML)
+
+            parts.append(f"📌 <b>ID: {post.id}</b>{status_info}\n")
+            parts.append(f"🏷️ Тема: {post.topic}\n")
+            parts.append(f"📅 Создан: {post.created_at.isoformat(sep=' ', timespec='minutes')}\n")
+            parts.append(f"🖼️ Изображение: {'✅' if post.image_url else '❌'}\n")
+            parts.append(f"👁️ Просмотр: /view_post_{post.id}\n\n")
+
+        if unpublished_total > 10:
+            parts.append(f"\n... и еще {unpublished_total - 10} постов\n")
+
+        parts.append("\n💡 Используйте /view_post_[ID] для просмотра полного текста поста")
+
+        await message.answer("".join(parts), parse_mode=ParseMode.HTML)
         
     except Exception as e:
         logger.error(f"Ошибка получения списка постов: {e}", exc_info=True)
         await message.answer(f"❌ Ошибка: {str(e)}")
-    finally:
-        db.close()
 
 
-@dp.message(Command("all_posts"))
+@admin_router.message(Command("all_posts"))
 async def cmd_all_posts(message: Message):
     """Показать все посты (краткий список)"""
-    if not is_admin(message.from_user.id):
-        return
     
-    from models import Post
-    db = SessionLocal()
-    
-    try:
-        all_posts = db.query(Post).order_by(Post.created_at.desc()).limit(20).all()
-        
-        if not all_posts:
-            await message.answer("📭 В базе данных нет постов")
-            return
-        
-        text = f"📝 <b>Все посты (показано {len(all_posts)} из последних):</b>\n\n"
-        
-        for post in all_posts:
-            status = "✅ Опубликован" if post.is_published else "⏳ Не опубликован"
-            text += f"📌 <b>ID: {post.id}</b> - {status}\n"
-            text += f"🏷️ {post.topic}\n"
-            text += f"📅 {post.created_at.strftime('%Y-%m-%d %H:%M')}\n"
-            text += f"👁️ /view_post_{post.id}\n\n"
-        
-        text += "\n💡 Используйте /view_post_[ID] для просмотра полного текста поста"
-        
-        await message.answer(text, parse_mode=ParseMode.HTML)
-        
-    finally:
-        db.close()
+    all_posts = await asyncio.to_thread(get_recent_posts, 20)
+
+    if not all_posts:
+        await message.answer("📭 В базе данных нет постов")
+        return
+
+    parts = [f"📝 <b>Все посты (показано {len(all_posts)} из последних):</b>\n\n"]
+
+    for post in all_posts:
+        status = "✅ Опубликован" if post.is_published else "⏳ Не опубликован"
+        parts.append(f"📌 <b>ID: {post.id}</b> - {status}\n")
+        parts.append(f"🏷️ {post.topic}\n")
+        parts.append(f"📅 {post.created_at.isoformat(sep=' ', timespec='minutes')}\n")
+        parts.append(f"👁️ /view_post_{post.id}\n\n")
+
+    parts.append("\n💡 Используйте /view_post_[ID] для просмотра полного текста поста")
+
+    await message.answer("".join(parts), parse_mode=ParseMode.HTML)
 
 
-@dp.message(Command("view_post"))
-async def cmd_view_post(message: Message):
+@admin_router.message(Command("view_post"))
+async def cmd_view_post(message: Message, command: CommandObject):
     """Просмотр конкретного поста по ID"""
-    if not is_admin(message.from_user.id):
-        return
-    
-    # Извлекаем ID из команды
-    parts = message.text.split(maxsplit=1)
-    if len(parts) < 2:
+
+    if not command.args:
         await message.answer(
             "❌ Укажите ID поста.\n\n"
             "Пример: /view_post 5\n\n"
             "Или используйте /list_posts для списка постов"
         )
         return
-    
+
     try:
-        post_id = int(parts[1])
+        post_id = int(command.args)
     except ValueError:
         await message.answer("❌ ID должен быть числом. Пример: /view_post 5")
         return
     
-    from models import Post
-    db = SessionLocal()
-    
-    try:
-        post = db.query(Post).filter(Post.id == post_id).first()
-        
-        if not post:
-            await message.answer(f"❌ Пост с ID {post_id} не найден")
-            return
-        
-        # Формируем информацию о посте
-        status = "✅ Опубликован" if post.is_published else "⏳ Не опубликован"
-        if post.published_at:
-            status += f" ({post.published_at.strftime('%Y-%m-%d %H:%M')})"
-        
-        text = f"📌 <b>ПОСТ ID: {post.id}</b>\n"
-        text += f"📅 Создан: {post.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
-        text += f"🏷️ Тема: {post.topic}\n"
-        text += f"📊 Статус: {status}\n"
-        if post.telegram_message_id:
-            text += f"💬 Telegram ID: {post.telegram_message_id}\n"
-        text += f"🖼️ Изображение: {'✅' if post.image_url else '❌'}\n\n"
-        text += f"📝 <b>ТЕКСТ ПОСТА:</b>\n\n"
-        text += f"{post.content}\n"
-        
-        # Telegram ограничение - 4096 символов
-        if len(text) > 4000:
-            # Разбиваем на части
-            part1 = text[:4000]
-            await message.answer(part1, parse_mode=ParseMode.HTML)
-            await message.answer(text[4000:], parse_mode=ParseMode.HTML)
-        else:
-            await message.answer(text, parse_mode=ParseMode.HTML)
-        
-    finally:
-        db.close()
+    post = await asyncio.to_thread(get_post_by_id, post_id)
+
+    if not post:
+        await message.answer(f"❌ Пост с ID {post_id} не найден")
+        return
+
+    # Формируем информацию о посте
+    status = "✅ Опубликован" if post.is_published else "⏳ Не опубликован"
+    if post.published_at:
+        status += f" ({post.published_at.isoformat(sep=' ', timespec='minutes')})"
 
+    text = f"📌 <b>ПОСТ ID: {post.id}</b>\n"
+    text += f"📅 Создан: {post.created_at.isoformat(sep=' ', timespec='seconds')}\n"
+    text += f"🏷️ Тема: {post.topic}\n"
+    text += f"📊 Статус: {status}\n"
+    if post.telegram_message_id:
+        text += f"💬 Telegram ID: {post.telegram_message_id}\n"
+    text += f"🖼️ Изображение: {'✅' if post.image_url else '❌'}\n\n"
+    text += f"📝 <b>ТЕКСТ ПОСТА:</b>\n\n"
+    text += f"{post.content}\n"
 
-@dp.message(Command("stats"))
+    # Telegram ограничение - 4096 символов; режем по границам строк
+    for chunk in _split_html_message(text):
+        await message.answer(chunk, parse_mode=ParseMode.HTML)
+
+
+@admin_router.message(Command("stats"))
 async def cmd_stats(message: Message):
     """Показать статистику"""
-    if not is_admin(message.from_user.id):
-        await message.answer("❌ У вас нет прав для использования этой команды.")
-        return
-    
-    from models import Post
-    db = SessionLocal()
     
-    try:
-        total_posts = db.query(Post).count()
-        from sqlalchemy import or_
-        published_posts = db.query(Post).filter(Post.is_published.is_(True)).count()
-        # Учитываем как False, так и NULL значения для неопубликованных постов
-        unpublished_posts = db.query(Post).filter(
-            or_(
-                Post.is_published.is_(False),
-                Post.is_published.is_(None)
-            )
-        ).count()
-        
-        text = f"""
+    diag = await asyncio.to_thread(get_posts_diagnostic)
+
+    # NULL в is_published считаем неопубликованными
+    unpublished_posts = diag['published_false'] + diag['published_null']
+
+    text = f"""
 📊 <b>Статистика бота:</b>
 
-📝 Всего постов: {total_posts}
-✅ Опубликовано: {published_posts}
+📝 Всего постов: {diag['total']}
+✅ Опубликовано: {diag['published_true']}
 ⏳ Ожидают публикации: {unpublished_posts}
 
-🤖 Бот работает с {datetime.now().strftime('%Y-%m-%d %H:%M')}
+🤖 Бот работает с {datetime.now().isoformat(sep=' ', timespec='minutes')}
 """
-        
-        await message.answer(text, parse_mode=ParseMode.HTML)
-        
-    finally:
-        db.close()
+
+    await message.answer(text, parse_mode=ParseMode.HTML)
 
 
-@dp.message(Command("db_diagnostic"))
+@admin_router.message(Command("db_diagnostic"))
 async def cmd_db_diagnostic(message: Message):
     """Диагностика базы данных постов"""
-    if not is_admin(message.from_user.id):
-        return
-    
-    from models import Post
-    db = SessionLocal()
     
     try:
-        # Получаем диагностику
-        diag = get_posts_diagnostic()
-        
-        # Исправляем NULL значения
-        fixed = fix_null_is_published()
-        
+        # Получаем диагностику (NULL значения исправляются при старте)
+        diag = await asyncio.to_thread(get_posts_diagnostic)
+
         # Получаем все посты для детальной информации
-        all_posts = db.query(Post).order_by(Post.created_at.desc()).limit(10).all()
-        
-        text = f"""🔍 <b>Диагностика базы данных:</b>
+        all_posts = await asyncio.to_thread(get_recent_posts, 10)
+
+        parts = [f"""🔍 <b>Диагностика базы данных:</b>
 
 📊 <b>Статистика:</b>
 • Всего постов: {diag['total']}
@@ -788,172 +827,117 @@ async def cmd_db_diagnostic(message: Message):
 • is_published = False: {diag['published_false']}
 • is_published = NULL: {diag['published_null']}
 
-{"✅ Исправлено NULL записей: " + str(fixed) if fixed > 0 else "✅ NULL записей не обнаружено"}
+{"⚠️ Записей с NULL: " + str(diag['published_null']) if diag['published_null'] > 0 else "✅ NULL записей не обнаружено"}
 
 📝 <b>Последние 10 постов:</b>
-"""
-        
+"""]
+
         for post in all_posts:
             status_icon = "✅" if post.is_published else ("❓" if post.is_published is None else "⏳")
             status_text = "Опубликован" if post.is_published else ("NULL" if post.is_published is None else "Не опубликован")
-            text += f"\n{status_icon} ID {post.id}: {post.topic[:30]}... ({status_text})"
-        
-        text += "\n\n💡 Используйте /list_posts для списка неопубликованных"
-        text += "\n💡 Используйте /fix_published_posts для исправления недавних постов"
-        
-        await message.answer(text, parse_mode=ParseMode.HTML)
+            parts.append(f"\n{status_icon} ID {post.id}: {post.topic[:30]}... ({status_text})")
+
+        parts.append("\n\n💡 Используйте /list_posts для списка неопубликованных")
+        parts.append("\n💡 Используйте /fix_published_posts для исправления недавних постов")
+
+        await message.answer("".join(parts), parse_mode=ParseMode.HTML)
         
     except Exception as e:
         logger.error(f"Ошибка диагностики БД: {e}", exc_info=True)
         await message.answer(f"❌ Ошибка: {str(e)}")
-    finally:
-        db.close()
 
 
-@dp.message(Command("fix_published_posts"))
+@admin_router.message(Command("fix_published_posts"))
 async def cmd_fix_published_posts(message: Message):
     """Исправить посты, которые были созданы через /generate, но помечены как опубликованные"""
-    if not is_admin(message.from_user.id):
-        return
-    
-    from models import Post
-    from datetime import datetime, timedelta
-    db = SessionLocal()
     
     try:
-        # Находим посты, которые были созданы недавно (за последние 24 часа)
-        # и помечены как опубликованные, но не имеют telegram_message_id
-        # Это обычно означает, что они были созданы через /generate, но неправильно помечены
-        yesterday = datetime.utcnow() - timedelta(days=1)
-        
-        # Ищем опубликованные посты без telegram_message_id, созданные недавно
-        posts_to_fix = db.query(Post).filter(
-            Post.is_published.is_(True),
-            Post.telegram_message_id.is_(None),
-            Post.created_at >= yesterday
-        ).all()
-        
-        if not posts_to_fix:
+        # Снимаем флаг публикации с недавних постов без telegram_message_id -
+        # обычно это посты, созданные через /generate, но неправильно помеченные
+        fixed_ids = await asyncio.to_thread(fix_recently_marked_published)
+
+        if not fixed_ids:
             await message.answer("✅ Нет постов для исправления.\n\n"
                                "Все недавние посты либо неопубликованы, либо имеют ID сообщения Telegram.")
             return
-        
-        fixed_count = 0
-        for post in posts_to_fix:
-            post.is_published = False
-            post.published_at = None
-            fixed_count += 1
-        
-        if fixed_count > 0:
-            db.commit()
-            await message.answer(f"✅ Исправлено {fixed_count} постов!\n\n"
-                               f"Посты ID: {', '.join([str(p.id) for p in posts_to_fix])}\n"
-                               f"были помечены как неопубликованные.\n\n"
-                               f"Теперь используйте /list_posts для проверки.")
-        else:
-            await message.answer("❌ Не удалось исправить посты")
-            
+
+        await message.answer(f"✅ Исправлено {len(fixed_ids)} постов!\n\n"
+                           f"Посты ID: {', '.join(str(post_id) for post_id in fixed_ids)}\n"
+                           f"были помечены как неопубликованные.\n\n"
+                           f"Теперь используйте /list_posts для проверки.")
+
     except Exception as e:
-        db.rollback()
         logger.error(f"Ошибка исправления постов: {e}", exc_info=True)
         await message.answer(f"❌ Ошибка: {str(e)}")
-    finally:
-        db.close()
 
 
 # ======================== ОБРАБОТЧИК КНОПОК ПРОСМОТРА ПОСТОВ ========================
 
-@dp.message(F.text.regexp(r'^/view_post_\d+$'))
-async def cmd_view_post_button(message: Message):
+@admin_router.message(F.text.regexp(_VIEW_POST_RE).as_("view_post_match"))
+async def cmd_view_post_button(message: Message, view_post_match: re.Match):
     """Обработчик кнопок /view_post_[ID]"""
-    if not is_admin(message.from_user.id):
-        return
+
+    # ID уже извлечен регуляркой фильтра
+    post_id = int(view_post_match.group(1))
     
-    # Извлекаем ID из команды
-    try:
-        post_id = int(message.text.split('_')[-1])
-    except ValueError:
-        await message.answer("❌ Неверный формат команды")
+    post = await asyncio.to_thread(get_post_by_id, post_id)
+
+    if not post:
+        await message.answer(f"❌ Пост с ID {post_id} не найден")
         return
-    
-    from models import Post
-    db = SessionLocal()
-    
-    try:
-        post = db.query(Post).filter(Post.id == post_id).first()
-        
-        if not post:
-            await message.answer(f"❌ Пост с ID {post_id} не найден")
-            return
-        
-        # Формируем информацию о посте
-        status = "✅ Опубликован" if post.is_published else "⏳ Не опубликован"
-        if post.published_at:
-            status += f" ({post.published_at.strftime('%Y-%m-%d %H:%M')})"
-        
-        text = f"📌 <b>ПОСТ ID: {post.id}</b>\n"
-        text += f"📅 Создан: {post.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
-        text += f"🏷️ Тема: {post.topic}\n"
-        text += f"📊 Статус: {status}\n"
-        if post.telegram_message_id:
-            text += f"💬 Telegram ID: {post.telegram_message_id}\n"
-        text += f"🖼️ Изображение: {'✅' if post.image_url else '❌'}\n\n"
-        text += f"📝 <b>ТЕКСТ ПОСТА:</b>\n\n"
-        text += f"{post.content}\n"
-        
-        # Telegram ограничение - 4096 символов
-        if len(text) > 4000:
-            # Разбиваем на части
-            part1 = text[:4000]
-            await message.answer(part1, parse_mode=ParseMode.HTML)
-            await message.answer(text[4000:], parse_mode=ParseMode.HTML)
-        else:
-            await message.answer(text, parse_mode=ParseMode.HTML)
-        
-    finally:
-        db.close()
+
+    # Формируем информацию о посте
+    status = "✅ Опубликован" if post.is_published else "⏳ Не опубликован"
+    if post.published_at:
+        status += f" ({post.published_at.isoformat(sep=' ', timespec='minutes')})"
+
+    text = f"📌 <b>ПОСТ ID: {post.id}</b>\n"
+    text += f"📅 Создан: {post.created_at.isoformat(sep=' ', timespec='seconds')}\n"
+    text += f"🏷️ Тема: {post.topic}\n"
+    text += f"📊 Статус: {status}\n"
+    if post.telegram_message_id:
+        text += f"💬 Telegram ID: {post.telegram_message_id}\n"
+    text += f"🖼️ Изображение: {'✅' if post.image_url else '❌'}\n\n"
+    text += f"📝 <b>ТЕКСТ ПОСТА:</b>\n\n"
+    text += f"{post.content}\n"
+
+    # Telegram ограничение - 4096 символов; режем по границам строк
+    for chunk in _split_html_message(text):
+        await message.answer(chunk, parse_mode=ParseMode.HTML)
 
 
 # ======================== ОБРАБОТЧИК НЕИЗВЕСТНЫХ КОМАНД ========================
 
-@dp.message()
+@fallback_router.message()
 async def handle_unknown_message(message: Message):
     """Обработчик всех неизвестных сообщений и команд"""
     logger.info(f"Получено сообщение от {message.from_user.id} (@{message.from_user.username}): {message.text}")
     
-    # Если это команда, но не распознана
-    if message.text and message.text.startswith('/'):
-        if not is_admin(message.from_user.id):
-            await message.answer(
-                "❌ У вас нет прав для использования этого бота.\n\n"
-                "Если вы администратор, проверьте, что ваш ID совпадает с ADMIN_ID в настройках.\n\n"
-                "Используйте команду /chatid для проверки вашего ID."
-            )
-        else:
-            await message.answer(
-                "❓ Неизвестная команда.\n\n"
-                "Используйте /help для просмотра доступных команд."
-            )
-    # Если это обычное сообщение
-    elif message.text:
-        if not is_admin(message.from_user.id):
-            await message.answer(
-                "👋 Привет! Я бот для автоматизации SMM-контента о путешествиях.\n\n"
-                "❌ У вас нет прав для использования этого бота.\n\n"
-                "Если вы администратор, проверьте настройки ADMIN_ID.\n"
-                "Используйте /start для начала работы."
-            )
-        else:
-            await message.answer(
-                "💬 Я понимаю только команды.\n\n"
-                "Используйте /help для просмотра доступных команд."
-            )
+    if not message.text:
+        return
+
+    is_command = message.text.startswith('/')
+
+    # Быстрый выход для чужого трафика: готовая константа, без
+    # форматирования и лишних ветвлений
+    if not is_admin(message.from_user.id):
+        await message.answer(_UNAUTH_CMD if is_command else _UNAUTH_MSG)
+        return
+
+    await message.answer(_UNKNOWN_CMD if is_command else _ONLY_CMDS)
 
 
 # ======================== ОСНОВНАЯ ФУНКЦИЯ ========================
 
-async def main():
-    """Главная функция запуска бота"""
+async def main(serve_webhook: bool = True):
+    """Главная функция запуска бота
+
+    Args:
+        serve_webhook: поднимать ли собственный aiohttp-сервер в режиме
+            webhook. False, когда бот работает внутри процесса API -
+            там обновления принимает FastAPI-endpoint на том же порту,
+            и второй сервер устроил бы гонку за адрес.
+    """
     logger.info("🚀 Запуск SMM-бота для путешествий...")
     
     try:
@@ -975,17 +959,6 @@ async def main():
         start_scheduler()
         logger.info("✅ Планировщик запущен")
         
-        # Проверяем и удаляем webhook если активен (polling не работает с webhook)
-        try:
-            webhook_info = await bot.get_webhook_info()
-            if webhook_info.url:
-                logger.warning(f"⚠️ Найден активный webhook: {webhook_info.url}")
-                logger.info("🔄 Удаляю webhook для использования polling...")
-                await bot.delete_webhook(drop_pending_updates=True)
-                logger.info("✅ Webhook удален")
-        except Exception as e:
-            logger.warning(f"⚠️ Ошибка при проверке webhook: {e}")
-        
         # Проверяем подключение к боту
         try:
             me = await bot.get_me()
@@ -995,10 +968,55 @@ async def main():
             import traceback
             traceback.print_exc()
             raise
-        
-        # Запускаем бота в режиме polling
-        logger.info("✅ Бот готов к работе! Ожидание сообщений...")
-        await dp.start_polling(bot, allowed_updates=["message", "callback_query"])
+
+        if config.USE_WEBHOOK and config.WEBHOOK_HOST:
+            # Режим webhook: Telegram сам пушит обновления - нет цикла
+            # getUpdates, его round-trip'ов и холостых запросов
+            from aiohttp import web
+            from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+            webhook_url = config.WEBHOOK_HOST + config.WEBHOOK_PATH
+            await bot.set_webhook(
+                url=webhook_url,
+                secret_token=config.WEBHOOK_SECRET,
+                drop_pending_updates=True,
+                allowed_updates=["message", "callback_query"]
+            )
+            logger.info(f"✅ Webhook установлен: {webhook_url}")
+
+            if serve_webhook:
+                app = web.Application()
+                SimpleRequestHandler(
+                    dispatcher=dp, bot=bot, secret_token=config.WEBHOOK_SECRET
+                ).register(app, path=config.WEBHOOK_PATH)
+                setup_application(app, dp, bot=bot)
+
+                runner = web.AppRunner(app)
+                await runner.setup()
+                site = web.TCPSite(runner, host=config.API_HOST, port=config.API_PORT)
+                await site.start()
+                logger.info("✅ Бот готов к работе (webhook)! Ожидание сообщений...")
+            else:
+                # Встроенный режим: обновления принимает FastAPI-endpoint
+                # API-сервера, свой HTTP-сервер не поднимаем
+                logger.info("✅ Бот готов к работе (webhook через API-сервер)! Ожидание сообщений...")
+            # Работаем до остановки процесса
+            await asyncio.Event().wait()
+        else:
+            # Режим polling: удаляем webhook если активен
+            # (polling не работает с webhook)
+            try:
+                webhook_info = await bot.get_webhook_info()
+                if webhook_info.url:
+                    logger.warning(f"⚠️ Найден активный webhook: {webhook_info.url}")
+                    logger.info("🔄 Удаляю webhook для использования polling...")
+                    await bot.delete_webhook(drop_pending_updates=True)
+                    logger.info("✅ Webhook удален")
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка при проверке webhook: {e}")
+
+            logger.info("✅ Бот готов к работе! Ожидание сообщений...")
+            await dp.start_polling(bot, allowed_updates=["message", "callback_query"])
         
     except KeyboardInterrupt:
         logger.info("⏸️ Остановка бота...")
@@ -4,15 +4,34 @@
 import os
 from dotenv import load_dotenv
 
-# Загружаем переменные окружения из .env файла
-load_dotenv()
+# Загружаем переменные окружения из .env файла (один раз на процесс,
+# чтобы повторные импорты/перезагрузки модуля не парсили .env заново)
+if not os.environ.get('_DOTENV_LOADED'):
+    load_dotenv()
+    os.environ['_DOTENV_LOADED'] = '1'
+
+def _parse_group_id(value):
+    """Нормализация ID группы: число - в int, иначе оставляем строкой
+
+    Выполняется один раз при импорте, чтобы не повторять
+    isinstance/int()-разбор при каждой публикации.
+    """
+    if not value:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
 
 class Config:
     """Класс для хранения конфигурации приложения"""
-    
+
     # Telegram настройки
     TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
     TELEGRAM_GROUP_ID = os.getenv('TELEGRAM_GROUP_ID')
+    # Нормализованный ID группы (int или строка) - готов к передаче в API
+    TELEGRAM_GROUP_ID_NORMALIZED = _parse_group_id(TELEGRAM_GROUP_ID)
     ADMIN_ID = int(os.getenv('ADMIN_ID', 0))
     
     # OpenAI настройки
@@ -37,9 +56,14 @@ class Config:
     WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook/telegram')
     WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', None)  # Секретный токен для безопасности (опционально)
     USE_WEBHOOK = os.getenv('USE_WEBHOOK', 'false').lower() == 'true'  # Использовать webhook вместо polling
+    # Запускать бота и API сервер в отдельных процессах (не делят GIL/event loop).
+    # Внимание: в этом режиме не работают in-process механизмы
+    # (очередь make_topic и webhook-диспетчеризация через API)
+    SEPARATE_PROCESSES = os.getenv('SEPARATE_PROCESSES', 'false').lower() == 'true'
     
-    # Темы для постов о путешествиях
-    TRAVEL_TOPICS = [
+    # Темы для постов о путешествиях (кортеж - неизменяемый и чуть
+    # быстрее при итерации/random.choice)
+    TRAVEL_TOPICS = (
         "Советы для путешественников",
         "Интересные места мира",
         "Культурные особенности стран",
@@ -52,7 +76,7 @@ class Config:
         "Советы по безопасности в путешествиях",
         "Лайфхаки для туристов",
         "Необычные отели и места проживания"
-    ]
+    )
     
     @classmethod
     def validate(cls):
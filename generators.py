@@ -1,17 +1,127 @@
 """
 Генераторы контента для SMM-бота с использованием OpenAI API
 """
+import os
 import random
-import requests
+import re
+import threading
+import time
 import logging
-from openai import OpenAI
 from config import config
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-# Инициализация клиента OpenAI
-client = OpenAI(api_key=config.OPENAI_API_KEY)
+# Собственный экземпляр RNG: не трогаем глобальное состояние random
+# при параллельных генерациях
+_rng = random.Random()
+
+# Директория для скачанных изображений: путь и mkdir - один раз
+# при импорте, а не на каждое скачивание
+_IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+os.makedirs(_IMAGES_DIR, exist_ok=True)
+
+# Регулярки для чистки DALL-E промптов (компилируются один раз):
+# признак "это фото" и слова, связанные с рисунками/иллюстрациями
+_PHOTO_RE = re.compile(
+    r'real photograph|dslr photograph|professional photograph|photograph taken',
+    re.IGNORECASE
+)
+_ART_RE = re.compile(
+    r'\b(?:illustration|drawing|artistic|painting|digital\s+art|rendering)\b',
+    re.IGNORECASE
+)
+
+# Системные промпты не зависят от вызова - собраны один раз при импорте.
+# Неизменный префикс в начале сообщения также позволяет OpenAI
+# переиспользовать prompt-кэш между запросами
+_SYSTEM_POST = "Ты - профессиональный SMM-менеджер для блога о путешествиях. Пиши кратко и по делу."
+_SYSTEM_IMAGE_PROMPT = "Ты создаешь промпты ТОЛЬКО для реальных фотографий. ВСЕГДА начинай промпт со слов 'A real photograph' или 'Professional photograph' или 'DSLR photograph'. НИКОГДА не используй слова 'illustration', 'drawing', 'artistic', 'painting'. Включи технические фото-термины: DSLR, lens, aperture, ISO."
+_SYSTEM_RECOMMEND = "Ты - профессиональный SMM-консультант для travel-блогов. Давай конкретные, практичные советы."
+_SYSTEM_IDEAS = "Ты - креативный SMM-специалист для travel-блога."
+_SYSTEM_ANALYZE = "Ты - SMM-аналитик для travel-контента."
+
+# Ленивая инициализация клиента OpenAI: импорт openai и создание
+# клиента откладываются до первого вызова генерации, чтобы не платить
+# за них при импорте модуля (холодный старт, обработчики без LLM)
+_client = None
+
+
+def _get_client():
+    """Получение (и создание при первом вызове) клиента OpenAI"""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI(api_key=config.OPENAI_API_KEY)
+    return _client
+
+# Кэш ответов LLM: {ключ: (time.monotonic() на момент записи, результат)}.
+# Повторный /recommend в течение дня и повторный /analyze той же идеи
+# возвращаются мгновенно и не тратят токены
+_llm_cache = {}
+_LLM_CACHE_TTL = 86400.0  # сутки
+_LLM_CACHE_STALE_TTL = 172800.0  # хард-лимит: старше двух суток не отдаем
+_LLM_CACHE_MAX_SIZE = 256
+
+# Ключи, по которым уже идет фоновое обновление (stale-while-revalidate)
+_llm_refreshing = set()
+_llm_refresh_lock = threading.Lock()
+
+
+def _llm_cache_get(key: str):
+    """Получение результата из кэша LLM (или None, если нет/протух)"""
+    entry = _llm_cache.get(key)
+    if entry and time.monotonic() - entry[0] < _LLM_CACHE_TTL:
+        return entry[1]
+    return None
+
+
+def _llm_cache_get_swr(key: str, refresh_fn):
+    """Кэш со stale-while-revalidate
+
+    Свежая запись возвращается сразу. Протухшая (но моложе хард-лимита)
+    тоже возвращается немедленно, а в фоне запускается поток обновления -
+    вызывающий не ждет LLM. refresh_fn должен вернуть новое значение
+    или None, если обновление не удалось (тогда кэш не трогаем).
+    """
+    entry = _llm_cache.get(key)
+    if not entry:
+        return None
+    age = time.monotonic() - entry[0]
+    if age < _LLM_CACHE_TTL:
+        return entry[1]
+    if age < _LLM_CACHE_STALE_TTL:
+        _schedule_llm_refresh(key, refresh_fn)
+        return entry[1]
+    return None
+
+
+def _schedule_llm_refresh(key: str, refresh_fn):
+    """Запуск фонового обновления кэша (не более одного на ключ)"""
+    with _llm_refresh_lock:
+        if key in _llm_refreshing:
+            return
+        _llm_refreshing.add(key)
+
+    def _worker():
+        try:
+            value = refresh_fn()
+            if value is not None:
+                _llm_cache_put(key, value)
+        finally:
+            with _llm_refresh_lock:
+                _llm_refreshing.discard(key)
+
+    threading.Thread(target=_worker, daemon=True).start()
+
+
+def _llm_cache_put(key: str, value):
+    """Сохранение результата в кэш LLM (с ограничением размера)"""
+    if len(_llm_cache) >= _LLM_CACHE_MAX_SIZE:
+        # Выбрасываем самую старую запись
+        oldest_key = min(_llm_cache, key=lambda k: _llm_cache[k][0])
+        _llm_cache.pop(oldest_key, None)
+    _llm_cache[key] = (time.monotonic(), value)
 
 
 def generate_post_text(topic: str = None) -> dict:
@@ -25,7 +135,7 @@ def generate_post_text(topic: str = None) -> dict:
         dict: Словарь с ключами 'topic', 'content', 'image_prompt'
     """
     if not topic:
-        topic = random.choice(config.TRAVEL_TOPICS)
+        topic = _rng.choice(config.TRAVEL_TOPICS)
     
     prompt = f"""Ты - SMM-эксперт, который создает контент для блога о путешествиях в Telegram.
     
@@ -44,10 +154,10 @@ def generate_post_text(topic: str = None) -> dict:
 Формат ответа: только текст поста, без дополнительных комментариев."""
 
     try:
-        response = client.chat.completions.create(
+        response = _get_client().chat.completions.create(
             model=config.OPENAI_MODEL,
             messages=[
-                {"role": "system", "content": "Ты - профессиональный SMM-менеджер для блога о путешествиях. Пиши кратко и по делу."},
+                {"role": "system", "content": _SYSTEM_POST},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.8,
@@ -66,7 +176,7 @@ def generate_post_text(topic: str = None) -> dict:
         }
         
     except Exception as e:
-        print(f"❌ Ошибка генерации текста: {e}")
+        logger.error("❌ Ошибка генерации текста: %s", e)
         return {
             'topic': topic,
             'content': f"Ошибка генерации контента: {str(e)}",
@@ -106,10 +216,10 @@ def generate_image_prompt(topic: str, post_content: str) -> str:
 Формат ответа: ТОЛЬКО промпт без дополнительных комментариев, без кавычек."""
 
     try:
-        response = client.chat.completions.create(
+        response = _get_client().chat.completions.create(
             model=config.OPENAI_MODEL,
             messages=[
-                {"role": "system", "content": "Ты создаешь промпты ТОЛЬКО для реальных фотографий. ВСЕГДА начинай промпт со слов 'A real photograph' или 'Professional photograph' или 'DSLR photograph'. НИКОГДА не используй слова 'illustration', 'drawing', 'artistic', 'painting'. Включи технические фото-термины: DSLR, lens, aperture, ISO."},
+                {"role": "system", "content": _SYSTEM_IMAGE_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7,
@@ -119,7 +229,7 @@ def generate_image_prompt(topic: str, post_content: str) -> str:
         return response.choices[0].message.content.strip()
         
     except Exception as e:
-        print(f"❌ Ошибка генерации промпта для изображения: {e}")
+        logger.error("❌ Ошибка генерации промпта для изображения: %s", e)
         return f"A real photograph of {topic}, professional travel photography, shot with DSLR camera, 35mm lens, natural lighting, high resolution, photorealistic, vibrant colors"
 
 
@@ -136,27 +246,25 @@ def generate_image(prompt: str) -> str:
     try:
         # Убеждаемся, что промпт явно указывает на реальную фотографию
         prompt_lower = prompt.lower()
-        
+
         # Проверяем и исправляем промпт, если нужно
-        if not any(word in prompt_lower for word in ["real photograph", "dslr photograph", "professional photograph", "photograph taken"]):
+        if not _PHOTO_RE.search(prompt):
             # Если промпт не начинается с указания на фото, добавляем в начало
             if not prompt_lower.startswith(("a real", "professional", "dslr")):
                 prompt = f"A real photograph, {prompt}"
-        
-        # Удаляем слова, связанные с рисунками, если они есть
-        art_words = ["illustration", "drawing", "artistic", "painting", "digital art", "rendering"]
-        for word in art_words:
-            if word in prompt_lower:
-                prompt = prompt.replace(word, "").replace(word.capitalize(), "")
-                print(f"⚠️ Удалено слово '{word}' из промпта")
-        
+
+        # Удаляем слова, связанные с рисунками - одной regex-подстановкой
+        prompt, removed = _ART_RE.subn('', prompt)
+        if removed:
+            logger.warning("⚠️ Удалено слов, связанных с рисунками: %s", removed)
+
         # Добавляем технические фото-термины, если их нет
         if "dslr" not in prompt_lower and "camera" not in prompt_lower:
             prompt = f"{prompt}, shot with professional DSLR camera, natural lighting"
         
-        print(f"🎨 Промпт для DALL-E: {prompt}")
+        logger.info("🎨 Промпт для DALL-E: %s", prompt)
         
-        response = client.images.generate(
+        response = _get_client().images.generate(
             model=config.DALLE_MODEL,
             prompt=prompt,
             size="1024x1024",
@@ -165,59 +273,71 @@ def generate_image(prompt: str) -> str:
         )
         
         image_url = response.data[0].url
-        print(f"✅ Реалистичная фотография сгенерирована: {image_url}")
+        logger.info("✅ Реалистичная фотография сгенерирована: %s", image_url)
         return image_url
         
     except Exception as e:
-        print(f"❌ Ошибка генерации изображения: {e}")
+        logger.error("❌ Ошибка генерации изображения: %s", e)
         return None
 
 
-def download_image(url: str, filename: str) -> str:
+# Переиспользуемая aiohttp-сессия для скачивания изображений:
+# keep-alive соединение с CDN вместо нового TLS-рукопожатия на каждый файл
+_http_session = None
+
+
+async def _get_http_session():
+    """Получение (и создание при первом вызове) aiohttp-сессии"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        import aiohttp
+        _http_session = aiohttp.ClientSession()
+    return _http_session
+
+
+async def download_image(url: str, filename: str) -> str:
     """
-    Скачивание изображения по URL
-    
+    Скачивание изображения по URL (асинхронно, потоково на диск)
+
+    Файл пишется кусками по 64KB по мере получения, а не буферизуется
+    целиком в памяти; event loop не блокируется на время скачивания.
+
     Args:
         url: URL изображения
         filename: Имя файла для сохранения
-        
+
     Returns:
         str: Путь к сохраненному файлу или None
     """
-    import os
-    
+    import aiohttp
+
     try:
         if not url or not url.strip():
             logger.warning("❌ URL изображения пустой")
             return None
-            
+
         logger.info(f"📥 Скачиваю изображение с URL: {url[:50]}...")
-        response = requests.get(url, timeout=30)
-        
-        # Проверяем статус ответа
-        if response.status_code == 403:
-            logger.error(f"❌ Ошибка 403: Доступ запрещен. Возможные причины: "
-                        f"API ключ OpenAI недействителен или истек срок действия URL изображения")
-            return None
-        elif response.status_code == 404:
-            logger.error(f"❌ Ошибка 404: Изображение не найдено по URL")
-            return None
-        
-        response.raise_for_status()
-        
-        # Получаем абсолютный путь к директории проекта
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        images_dir = os.path.join(base_dir, "images")
-        
-        # Создаем директорию, если её нет
-        os.makedirs(images_dir, exist_ok=True)
-        
-        filepath = os.path.join(images_dir, filename)
-        
-        logger.info(f"💾 Сохраняю изображение в: {filepath}")
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
-        
+        session = await _get_http_session()
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
+            # Проверяем статус ответа
+            if response.status == 403:
+                logger.error(f"❌ Ошибка 403: Доступ запрещен. Возможные причины: "
+                            f"API ключ OpenAI недействителен или истек срок действия URL изображения")
+                return None
+            elif response.status == 404:
+                logger.error(f"❌ Ошибка 404: Изображение не найдено по URL")
+                return None
+
+            response.raise_for_status()
+
+            # Директория создана при импорте модуля
+            filepath = os.path.join(_IMAGES_DIR, filename)
+
+            logger.info(f"💾 Сохраняю изображение в: {filepath}")
+            with open(filepath, 'wb') as f:
+                async for chunk in response.content.iter_chunked(65536):
+                    f.write(chunk)
+
         # Проверяем, что файл создан
         if os.path.exists(filepath):
             file_size = os.path.getsize(filepath)
@@ -226,14 +346,12 @@ def download_image(url: str, filename: str) -> str:
         else:
             logger.error(f"❌ Файл не был создан: {filepath}")
             return None
-        
-    except requests.exceptions.HTTPError as e:
+
+    except aiohttp.ClientResponseError as e:
         logger.error(f"❌ HTTP ошибка при скачивании изображения: {e}")
-        if hasattr(e.response, 'status_code'):
-            logger.error(f"   Код статуса: {e.response.status_code}")
-            logger.error(f"   Ответ сервера: {e.response.text[:200]}")
+        logger.error(f"   Код статуса: {e.status}")
         return None
-    except requests.exceptions.RequestException as e:
+    except aiohttp.ClientError as e:
         logger.error(f"❌ Ошибка сети при скачивании изображения: {e}")
         return None
     except Exception as e:
@@ -251,30 +369,30 @@ def generate_complete_post(topic: str = None) -> dict:
     Returns:
         dict: Словарь с полной информацией о посте
     """
-    print(f"🔄 Начинаем генерацию поста...")
+    logger.info("🔄 Начинаем генерацию поста...")
     
     # Генерируем текст
     post_data = generate_post_text(topic)
-    print(f"✅ Текст поста сгенерирован на тему: {post_data['topic']}")
-    print(f"📝 Длина текста: {len(post_data['content'])} символов")
+    logger.info("✅ Текст поста сгенерирован на тему: %s", post_data['topic'])
+    logger.info("📝 Длина текста: %s символов", len(post_data['content']))
     
     # Генерируем изображение
     if post_data.get('image_prompt'):
-        print(f"🎨 Генерирую изображение с промптом: {post_data['image_prompt'][:100]}...")
+        logger.info("🎨 Генерирую изображение с промптом: %s...", post_data['image_prompt'][:100])
         image_url = generate_image(post_data['image_prompt'])
         if image_url:
-            print(f"✅ Изображение сгенерировано: {image_url}")
+            logger.info("✅ Изображение сгенерировано: %s", image_url)
             post_data['image_url'] = image_url
         else:
-            print(f"⚠️ Не удалось сгенерировать изображение")
+            logger.warning("⚠️ Не удалось сгенерировать изображение")
             post_data['image_url'] = None
     else:
-        print(f"⚠️ Промпт для изображения не был создан")
+        logger.warning("⚠️ Промпт для изображения не был создан")
         post_data['image_url'] = None
     
-    print(f"📊 Итоговые данные поста:")
-    print(f"   - Тема: {post_data.get('topic')}")
-    print(f"   - Изображение: {'Есть' if post_data.get('image_url') else 'Нет'}")
+    logger.info("📊 Итоговые данные поста:")
+    logger.info("   - Тема: %s", post_data.get('topic'))
+    logger.info("   - Изображение: %s", 'Есть' if post_data.get('image_url') else 'Нет')
     
     return post_data
 
@@ -290,7 +408,12 @@ def generate_content_recommendations() -> dict:
     
     current_month = datetime.now().strftime("%B")
     current_season = get_current_season()
-    
+
+    # Рекомендации зависят только от месяца и сезона - кэшируем на сутки
+    # со stale-while-revalidate: протухший ответ отдаем сразу,
+    # обновление идет в фоне
+    cache_key = f"recommend:{current_month}:{current_season}"
+
     prompt = f"""Ты - SMM-эксперт для блога о путешествиях в Telegram.
 
 Сейчас: {current_month}, {current_season}
@@ -317,33 +440,47 @@ def generate_content_recommendations() -> dict:
 
 Формат: структурированный текст с эмодзи, готовый для отправки в Telegram."""
 
-    try:
-        response = client.chat.completions.create(
-            model=config.OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": "Ты - профессиональный SMM-консультант для travel-блогов. Давай конкретные, практичные советы."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1000
-        )
-        
-        recommendations = response.choices[0].message.content.strip()
-        
-        return {
-            'success': True,
-            'recommendations': recommendations,
-            'season': current_season,
-            'month': current_month
-        }
-        
-    except Exception as e:
-        print(f"❌ Ошибка генерации рекомендаций: {e}")
-        return {
-            'success': False,
-            'error': str(e),
-            'recommendations': None
-        }
+    def _fetch():
+        try:
+            response = _get_client().chat.completions.create(
+                model=config.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": _SYSTEM_RECOMMEND},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                max_tokens=1000
+            )
+
+            recommendations = response.choices[0].message.content.strip()
+
+            return {
+                'success': True,
+                'recommendations': recommendations,
+                'season': current_season,
+                'month': current_month
+            }
+
+        except Exception as e:
+            logger.error("❌ Ошибка генерации рекомендаций: %s", e)
+            return {
+                'success': False,
+                'error': str(e),
+                'recommendations': None
+            }
+
+    def _refresh():
+        result = _fetch()
+        return result if result['success'] else None
+
+    cached = _llm_cache_get_swr(cache_key, _refresh)
+    if cached:
+        return cached
+
+    result = _fetch()
+    if result['success']:
+        _llm_cache_put(cache_key, result)
+    return result
 
 
 def generate_topic_ideas(count: int = 5) -> dict:
@@ -357,7 +494,11 @@ def generate_topic_ideas(count: int = 5) -> dict:
         dict: Словарь с идеями тем
     """
     current_season = get_current_season()
-    
+
+    # Идеи зависят только от сезона и количества - кэшируем на сутки
+    # со stale-while-revalidate (как и рекомендации)
+    cache_key = f"ideas:{current_season}:{count}"
+
     prompt = f"""Предложи {count} уникальных и интересных тем для постов в Telegram-блоге о путешествиях.
 
 Текущий сезон: {current_season}
@@ -375,32 +516,46 @@ def generate_topic_ideas(count: int = 5) -> dict:
 
 Без лишних комментариев, только список тем."""
 
-    try:
-        response = client.chat.completions.create(
-            model=config.OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": "Ты - креативный SMM-специалист для travel-блога."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.9,
-            max_tokens=500
-        )
-        
-        ideas = response.choices[0].message.content.strip()
-        
-        return {
-            'success': True,
-            'ideas': ideas,
-            'count': count,
-            'season': current_season
-        }
-        
-    except Exception as e:
-        print(f"❌ Ошибка генерации идей: {e}")
-        return {
-            'success': False,
-            'error': str(e)
-        }
+    def _fetch():
+        try:
+            response = _get_client().chat.completions.create(
+                model=config.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": _SYSTEM_IDEAS},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.9,
+                max_tokens=500
+            )
+
+            ideas = response.choices[0].message.content.strip()
+
+            return {
+                'success': True,
+                'ideas': ideas,
+                'count': count,
+                'season': current_season
+            }
+
+        except Exception as e:
+            logger.error("❌ Ошибка генерации идей: %s", e)
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    def _refresh():
+        result = _fetch()
+        return result if result['success'] else None
+
+    cached = _llm_cache_get_swr(cache_key, _refresh)
+    if cached:
+        return cached
+
+    result = _fetch()
+    if result['success']:
+        _llm_cache_put(cache_key, result)
+    return result
 
 
 def get_current_season() -> str:
@@ -428,6 +583,13 @@ def analyze_post_idea(idea: str) -> dict:
     Returns:
         dict: Анализ и рекомендации
     """
+    # Нормализуем идею (регистр, лишние пробелы), чтобы повторный ввод
+    # той же идеи попадал в кэш
+    cache_key = "analyze:" + " ".join(idea.lower().split())
+    cached = _llm_cache_get(cache_key)
+    if cached:
+        return cached
+
     prompt = f"""Проанализируй эту идею для поста в travel-блоге: "{idea}"
 
 Дай краткий анализ:
@@ -441,10 +603,10 @@ def analyze_post_idea(idea: str) -> dict:
 Будь кратким и конкретным."""
 
     try:
-        response = client.chat.completions.create(
+        response = _get_client().chat.completions.create(
             model=config.OPENAI_MODEL,
             messages=[
-                {"role": "system", "content": "Ты - SMM-аналитик для travel-контента."},
+                {"role": "system", "content": _SYSTEM_ANALYZE},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7,
@@ -452,15 +614,17 @@ def analyze_post_idea(idea: str) -> dict:
         )
         
         analysis = response.choices[0].message.content.strip()
-        
-        return {
+
+        result = {
             'success': True,
             'idea': idea,
             'analysis': analysis
         }
+        _llm_cache_put(cache_key, result)
+        return result
         
     except Exception as e:
-        print(f"❌ Ошибка анализа идеи: {e}")
+        logger.error("❌ Ошибка анализа идеи: %s", e)
         return {
             'success': False,
             'error': str(e)
@@ -3,11 +3,13 @@
 """
 import os
 import stat
+import time
 import logging
-from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, or_
+from functools import lru_cache, wraps
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, select, insert, func, case, Column, Integer, String, Text, DateTime, Boolean, Index, or_
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
 from config import config
 
 Base = declarative_base()
@@ -24,9 +26,18 @@ class Post(Base):
     image_prompt = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     published_at = Column(DateTime, nullable=True)
-    is_published = Column(Boolean, default=False, nullable=True)  # nullable=True для совместимости со старыми записями
+    # NOT NULL + server_default для новых БД; старые записи с NULL
+    # исправляются одноразовой миграцией в init_db()
+    is_published = Column(Boolean, default=False, nullable=False, server_default="0")
     telegram_message_id = Column(Integer, nullable=True)
-    
+
+    # Составной индекс под основной запрос "неопубликованные, свежие
+    # сначала": фильтр по is_published + ORDER BY created_at DESC
+    # обслуживаются одним индексом без сортировки в памяти
+    __table_args__ = (
+        Index('ix_posts_pub_created', 'is_published', 'created_at'),
+    )
+
     def __repr__(self):
         return f"<Post(id={self.id}, topic='{self.topic}', is_published={self.is_published})>"
 
@@ -42,7 +53,12 @@ class Schedule(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     last_run = Column(DateTime, nullable=True)
-    
+
+    # Индекс под выборку активного расписания (фильтр по is_active)
+    __table_args__ = (
+        Index('ix_schedules_active', 'is_active'),
+    )
+
     def __repr__(self):
         return f"<Schedule(id={self.id}, frequency='{self.frequency}', time='{self.time}')>"
 
@@ -76,6 +92,21 @@ def fix_db_permissions(db_path: str):
     except Exception as e:
         logger.warning(f"⚠️ Не удалось установить права доступа к БД: {e}")
 
+
+@lru_cache(maxsize=1)
+def _ensure_permissions_once():
+    """Однократная проверка/исправление прав доступа к файлу БД
+
+    stat/chmod - это syscall-ы; держим их вне горячих путей записи и
+    выполняем один раз за процесс (lru_cache гарантирует одноразовость).
+    """
+    if db_path:
+        try:
+            fix_db_permissions(db_path)
+        except Exception as e:
+            logger.warning(f"⚠️ Предупреждение при проверке прав БД: {e}")
+    return True
+
 # Извлекаем путь к файлу БД из DATABASE_URL
 db_path = None
 if config.DATABASE_URL and config.DATABASE_URL.startswith('sqlite'):
@@ -85,46 +116,138 @@ if config.DATABASE_URL and config.DATABASE_URL.startswith('sqlite'):
         db_path = db_path[2:]
     if not db_path:
         db_path = 'travel_bot.db'
-    
-    # Исправляем права при запуске
-    try:
-        fix_db_permissions(db_path)
-    except Exception as e:
-        logger.warning(f"⚠️ Предупреждение при проверке прав БД: {e}")
 
-# Создание движка базы данных
-engine = create_engine(config.DATABASE_URL, echo=False)
+# Исправляем права один раз при запуске
+_ensure_permissions_once()
 
-# Создание всех таблиц
+# Создание движка базы данных
+# pool_pre_ping - проверка соединения при выдаче из пула, чтобы не
+# получить протухшее соединение после простоя;
+# pool_use_lifo - из пула выдается последнее вернувшееся соединение
+# (его страницы еще горячие в кэшах);
+# check_same_thread=False - хелперы вызываются из asyncio.to_thread,
+# поэтому соединения из пула переходят между потоками
+_connect_args = {}
+if config.DATABASE_URL.startswith('sqlite'):
+    _connect_args['check_same_thread'] = False
+engine = create_engine(
+    config.DATABASE_URL,
+    echo=False,
+    pool_pre_ping=True,
+    pool_use_lifo=True,
+    insertmanyvalues_page_size=1000,
+    connect_args=_connect_args
+)
+
+# Тюнинг SQLite на каждом новом соединении:
+# - journal_mode=WAL - читатели не блокируются писателем
+#   (например, /list_posts не ждет INSERT от /generate)
+# - synchronous=NORMAL - меньше fsync при сохранении долговечности WAL
+# - temp_store=MEMORY - временные структуры в памяти, а не на диске
+# - mmap_size=256MB - чтение страниц через mmap вместо syscall read()
+# - cache_size=-20000 - страничный кэш ~20MB вместо дефолтных ~2MB
+if config.DATABASE_URL.startswith('sqlite'):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.execute("PRAGMA cache_size=-20000")
+        cursor.close()
+
+# Создание всех таблиц (права уже проверены выше, один раз за процесс)
 Base.metadata.create_all(engine)
 
-# Повторно проверяем права после создания таблиц
-if db_path:
-    try:
-        fix_db_permissions(db_path)
-    except Exception as e:
-        logger.warning(f"⚠️ Предупреждение при проверке прав БД: {e}")
-
 # Создание фабрики сессий
-SessionLocal = sessionmaker(bind=engine)
-
-
-def get_db():
-    """Получение сессии базы данных"""
-    db = SessionLocal()
-    try:
-        return db
-    finally:
-        pass
+# expire_on_commit=False - чтобы доступ к атрибутам (post.id и т.д.)
+# после commit не вызывал повторный SELECT.
+# scoped_session - сессии привязаны к потоку: повторные вызовы хелперов
+# из одного потока переиспользуют сессию и ее соединение вместо
+# открытия нового
+SessionLocal = scoped_session(sessionmaker(bind=engine, expire_on_commit=False))
+
+
+# Кэш списка неопубликованных постов: (time.monotonic() на момент запроса, список)
+# Живет недолго (TTL) и сбрасывается при любой записи постов
+_unpublished_cache = None
+_unpublished_summary_cache = None
+_diagnostic_cache = None
+_UNPUBLISHED_CACHE_TTL = 5.0
+_DIAGNOSTIC_CACHE_TTL = 30.0
+
+# Кэш активного расписания: меняется только командами /schedule_*,
+# а читается на каждый запрос статуса и каждый запуск задачи
+_schedule_cache = None
+_SCHEDULE_CACHE_TTL = 60.0
+
+
+def invalidate_unpublished_cache():
+    """Сброс кэшей постов (вызывается при записи)"""
+    global _unpublished_cache, _unpublished_summary_cache, _diagnostic_cache
+    _unpublished_cache = None
+    _unpublished_summary_cache = None
+    _diagnostic_cache = None
+
+
+def invalidate_schedule_cache():
+    """Сброс кэша активного расписания (вызывается при изменении расписания)"""
+    global _schedule_cache
+    _schedule_cache = None
+
+
+def _with_db_session(*invalidators):
+    """Декоратор для write-хелперов: сессия первым аргументом
+
+    Коммитит при успешном возврате, откатывает и пробрасывает ошибку
+    при сбое, всегда закрывает сессию. Убирает одинаковый
+    try/commit/rollback/close из каждого хелпера и дает одну точку
+    для будущих изменений транзакционной логики.
+
+    invalidators - функции сброса кэшей; вызываются строго ПОСЛЕ
+    успешного commit: сброс внутри тела хелпера позволял бы
+    конкурентному читателю заполнить кэш еще не закоммиченными данными
+    на весь TTL.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            db = SessionLocal()
+            try:
+                result = fn(db, *args, **kwargs)
+                db.commit()
+            except PermissionError as e:
+                db.rollback()
+                logger.error(f"❌ Ошибка прав доступа в {fn.__name__}: {e}")
+                logger.error("💡 Проверьте права на файл БД: chmod 666 travel_bot.db")
+                raise
+            except Exception as e:
+                db.rollback()
+                logger.error(f"❌ Ошибка в {fn.__name__}: {e}")
+                raise
+            finally:
+                db.close()
+            for invalidate in invalidators:
+                invalidate()
+            return result
+        return wrapper
+    return decorator
 
 
 def init_db():
     """Инициализация базы данных"""
     try:
         Base.metadata.create_all(engine)
-        # Исправляем права после создания
-        if db_path:
-            fix_db_permissions(db_path)
+        # create_all(checkfirst) пропускает уже существующие таблицы
+        # целиком, поэтому индексы, добавленные после создания БД,
+        # нужно создавать явно (checkfirst=True - IF NOT EXISTS)
+        for table in Base.metadata.tables.values():
+            for index in table.indexes:
+                index.create(engine, checkfirst=True)
+        _ensure_permissions_once()
         # Исправляем NULL значения в is_published (если есть)
         try:
             fixed = fix_null_is_published()
@@ -143,120 +266,175 @@ def init_db():
         raise
 
 
-def add_post(topic: str, content: str, image_url: str = None, image_prompt: str = None, is_published: bool = False):
+@_with_db_session(invalidate_unpublished_cache)
+def add_post(db, topic: str, content: str, image_url: str = None, image_prompt: str = None, is_published: bool = False):
     """Добавление нового поста в базу данных"""
-    db = SessionLocal()
-    try:
-        # Явно устанавливаем is_published=False для всех новых постов (если не указано иное)
-        post = Post(
-            topic=topic,
-            content=content,
-            image_url=image_url,
-            image_prompt=image_prompt,
-            is_published=is_published  # Явно устанавливаем значение
-        )
-        db.add(post)
-        db.commit()
-        db.refresh(post)
-        
-        # Логируем создание поста для диагностики
-        logger.info(f"💾 Пост создан: ID={post.id}, topic='{topic[:30]}...', is_published={post.is_published}, тип={type(post.is_published)}")
-        
-        # Дополнительная проверка: если после сохранения значение не False/0/None, выводим предупреждение
-        if post.is_published not in (False, None, 0):
-            logger.warning(f"⚠️ Пост ID={post.id} создан с is_published={post.is_published} вместо False!")
-        
-        return post
-    except PermissionError as e:
-        logger.error(f"❌ Ошибка прав доступа при добавлении поста: {e}")
-        db.rollback()
-        # Пытаемся исправить права и повторить
-        if db_path:
-            try:
-                fix_db_permissions(db_path)
-                db.commit()
-                db.refresh(post)
-                logger.info("✅ Права исправлены, пост добавлен")
-                return post
-            except:
-                pass
-        raise
-    except Exception as e:
-        logger.error(f"❌ Ошибка при добавлении поста: {e}")
-        db.rollback()
-        raise
-    finally:
-        db.close()
+    # Явно устанавливаем is_published=False для всех новых постов (если не указано иное)
+    post = Post(
+        topic=topic,
+        content=content,
+        image_url=image_url,
+        image_prompt=image_prompt,
+        is_published=is_published  # Явно устанавливаем значение
+    )
+    db.add(post)
+    # flush выдает ID до commit (commit выполнит декоратор)
+    db.flush()
+
+    # Логируем создание поста для диагностики (ленивое форматирование -
+    # строка не собирается, если уровень INFO отключен)
+    logger.info("💾 Пост создан: ID=%s, topic='%s...', is_published=%s, тип=%s",
+                post.id, topic[:30], post.is_published, type(post.is_published))
+
+    # Дополнительная проверка: если после сохранения значение не False/0/None, выводим предупреждение
+    if post.is_published not in (False, None, 0):
+        logger.warning("⚠️ Пост ID=%s создан с is_published=%s вместо False!",
+                       post.id, post.is_published)
+
+    return post
+
+
+@_with_db_session(invalidate_unpublished_cache)
+def add_posts(db, rows: list):
+    """Батчевое добавление постов (для сидинга/бэкфилла)
+
+    rows - список словарей с ключами topic, content, image_url,
+    image_prompt, is_published. Все строки вставляются одним
+    многострочным INSERT (insertmanyvalues) в одной транзакции -
+    один fsync вместо одного на пост. Возвращает список id
+    вставленных постов.
+    """
+    if not rows:
+        return []
+    for row in rows:
+        row.setdefault('is_published', False)
+    result = db.execute(insert(Post).returning(Post.id), rows)
+    ids = [r[0] for r in result]
+    logger.info("💾 Батчем добавлено постов: %d", len(ids))
+    return ids
+
+
+@_with_db_session(invalidate_unpublished_cache)
+def fix_null_is_published(db):
+    """Исправить NULL значения в поле is_published (установить False для всех NULL)
+
+    Единственный вызов - из init_db(), который сам перехватывает
+    ошибки, чтобы не блокировать инициализацию.
+    """
+    # Один батчевый UPDATE вместо загрузки строк и поштучного
+    # изменения: O(1) запросов независимо от числа записей.
+    # synchronize_session=False - в сессии нет загруженных Post,
+    # которые нужно было бы синхронизировать
+    fixed_count = db.query(Post).filter(Post.is_published.is_(None)).update(
+        {Post.is_published: False}, synchronize_session=False
+    )
+    if fixed_count > 0:
+        logger.info(f"✅ Исправлено {fixed_count} записей с NULL в is_published")
+    return fixed_count
+
 
+def get_posts_diagnostic():
+    """Диагностическая информация о постах в БД (кэшируется на 30 секунд)"""
+    global _diagnostic_cache
+    now = time.monotonic()
+    if _diagnostic_cache and now - _diagnostic_cache[0] < _DIAGNOSTIC_CACHE_TTL:
+        return _diagnostic_cache[1]
 
-def fix_null_is_published():
-    """Исправить NULL значения в поле is_published (установить False для всех NULL)"""
     db = SessionLocal()
     try:
-        # Находим все записи с NULL значением
-        posts_with_null = db.query(Post).filter(Post.is_published.is_(None)).all()
-        fixed_count = 0
-        for post in posts_with_null:
-            post.is_published = False
-            fixed_count += 1
-        if fixed_count > 0:
-            db.commit()
-            logger.info(f"✅ Исправлено {fixed_count} записей с NULL в is_published")
-        return fixed_count
-    except Exception as e:
-        db.rollback()
-        logger.error(f"❌ Ошибка при исправлении NULL значений: {e}")
-        # Не поднимаем исключение, чтобы не блокировать инициализацию
-        return 0
+        # Один проход по таблице вместо четырех отдельных COUNT
+        row = db.execute(
+            select(
+                func.count(),
+                func.sum(case((Post.is_published.is_(True), 1), else_=0)),
+                func.sum(case((Post.is_published.is_(False), 1), else_=0)),
+                func.sum(case((Post.is_published.is_(None), 1), else_=0))
+            ).select_from(Post)
+        ).one()
+
+        diag = {
+            'total': row[0] or 0,
+            'published_true': row[1] or 0,
+            'published_false': row[2] or 0,
+            'published_null': row[3] or 0
+        }
+        _diagnostic_cache = (now, diag)
+        return diag
     finally:
         db.close()
 
 
-def get_posts_diagnostic():
-    """Диагностическая информация о постах в БД"""
+def get_unpublished_posts_cached():
+    """Получение неопубликованных постов через короткоживущий кэш
+
+    Частые опросы (например, Make.com) не должны каждый раз ходить в БД.
+    """
+    global _unpublished_cache
+    now = time.monotonic()
+    if _unpublished_cache and now - _unpublished_cache[0] < _UNPUBLISHED_CACHE_TTL:
+        return _unpublished_cache[1]
+    posts = get_unpublished_posts()
+    _unpublished_cache = (now, posts)
+    return posts
+
+
+def get_unpublished_posts_summary(limit: int = 10):
+    """Краткий список неопубликованных постов (только нужные колонки)
+
+    Для API-списка не нужны content и image_prompt - выбираем только
+    id, topic, created_at, image_url без полной материализации
+    ORM-объектов. Результат кэшируется с тем же TTL, что и полный
+    список; кэш привязан к limit, чтобы вызов с другим значением не
+    получил строки, закэшированные для предыдущего.
+    """
+    global _unpublished_summary_cache
+    now = time.monotonic()
+    if (_unpublished_summary_cache
+            and _unpublished_summary_cache[1] == limit
+            and now - _unpublished_summary_cache[0] < _UNPUBLISHED_CACHE_TTL):
+        return _unpublished_summary_cache[2]
+
     db = SessionLocal()
     try:
-        total = db.query(Post).count()
-        published_true = db.query(Post).filter(Post.is_published.is_(True)).count()
-        published_false = db.query(Post).filter(Post.is_published.is_(False)).count()
-        published_null = db.query(Post).filter(Post.is_published.is_(None)).count()
-        
-        return {
-            'total': total,
-            'published_true': published_true,
-            'published_false': published_false,
-            'published_null': published_null
-        }
+        rows = db.execute(
+            select(Post.id, Post.topic, Post.is_published,
+                   Post.created_at, Post.image_url)
+            .where(or_(
+                Post.is_published.is_(None),
+                Post.is_published.is_(False)
+            ))
+            .order_by(Post.created_at.desc())
+            .limit(limit)
+        ).all()
+        _unpublished_summary_cache = (now, limit, rows)
+        return rows
     finally:
         db.close()
 
 
-def get_unpublished_posts():
-    """Получение неопубликованных постов, отсортированных по дате создания (последние сначала)"""
-    from sqlalchemy import case
+def get_unpublished_posts(limit: int = None):
+    """Получение неопубликованных постов, отсортированных по дате создания (последние сначала)
+
+    Фильтрация выполняется в SQL (IS NULL OR = 0 покрывает все варианты
+    хранения Boolean в SQLite), поэтому переносится только нужная часть
+    таблицы, а не все посты. Запрос обслуживается индексом
+    ix_posts_pub_created. limit=1 - когда нужен только самый свежий пост.
+    """
     db = SessionLocal()
     try:
-        # В SQLite Boolean хранится как INTEGER (0 или 1) или NULL
-        # Используем более явное сравнение для совместимости с SQLite
-        # Неопубликованные посты: is_published IS NULL, is_published = 0, или is_published = False
-        
-        # Сначала получаем все посты и фильтруем в Python для надежности
-        # Это гарантирует работу независимо от того, как SQLite хранит Boolean
-        all_posts = db.query(Post).order_by(Post.created_at.desc()).all()
-        
-        unpublished = []
-        for post in all_posts:
-            # Проверяем все возможные варианты "неопубликовано"
-            if (post.is_published is None or 
-                post.is_published is False or 
-                post.is_published == 0 or
-                post.is_published == False):
-                unpublished.append(post)
-        
-        logger.info(f"📊 Всего постов: {len(all_posts)}, неопубликованных: {len(unpublished)}")
-        if unpublished:
-            logger.info(f"   Первый неопубликованный: ID {unpublished[0].id}, is_published={unpublished[0].is_published}, тип={type(unpublished[0].is_published)}")
-        
+        stmt = (
+            select(Post)
+            .where(or_(
+                Post.is_published.is_(None),
+                Post.is_published.is_(False)
+            ))
+            .order_by(Post.created_at.desc())
+        )
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        unpublished = db.execute(stmt).scalars().all()
+
+        logger.info("📊 Неопубликованных постов получено: %d", len(unpublished))
         return unpublished
     except Exception as e:
         logger.error(f"❌ Ошибка получения неопубликованных постов: {e}", exc_info=True)
@@ -265,74 +443,129 @@ def get_unpublished_posts():
         db.close()
 
 
-def mark_post_published(post_id: int, message_id: int):
+@_with_db_session(invalidate_unpublished_cache)
+def mark_post_published(db, post_id: int, message_id: int):
     """Отметить пост как опубликованный"""
+    # db.get - быстрый путь доступа по первичному ключу (identity map)
+    post = db.get(Post, post_id)
+    if post:
+        post.is_published = True
+        post.published_at = datetime.utcnow()
+        post.telegram_message_id = message_id
+        return True
+    return False
+
+
+def get_recent_posts(limit: int = 20):
+    """Получение последних постов (новые сначала)
+
+    Возвращает облегченные Row-объекты только с полями для списков
+    (без content/image_prompt) - полная материализация ORM-объектов
+    с большим текстом поста тут не нужна.
+    """
     db = SessionLocal()
     try:
-        post = db.query(Post).filter(Post.id == post_id).first()
-        if post:
-            post.is_published = True
-            post.published_at = datetime.utcnow()
-            post.telegram_message_id = message_id
-            db.commit()
-            return True
-        return False
-    except PermissionError as e:
-        logger.error(f"❌ Ошибка прав доступа при обновлении поста: {e}")
-        db.rollback()
-        if db_path:
-            try:
-                fix_db_permissions(db_path)
-                db.commit()
-                logger.info("✅ Права исправлены, пост обновлен")
-                return True
-            except:
-                pass
-        raise
-    except Exception as e:
-        logger.error(f"❌ Ошибка при обновлении поста: {e}")
-        db.rollback()
-        raise
+        return db.execute(
+            select(Post.id, Post.topic, Post.is_published,
+                   Post.created_at, Post.image_url)
+            .order_by(Post.created_at.desc())
+            .limit(limit)
+        ).all()
     finally:
         db.close()
 
 
-def get_active_schedule():
-    """Получение активного расписания"""
+def get_post_by_id(post_id: int):
+    """Получение поста по ID"""
     db = SessionLocal()
     try:
-        # Используем .is_(True) для правильной работы с Boolean типом в SQLAlchemy
-        return db.query(Schedule).filter(Schedule.is_active.is_(True)).first()
+        # db.get - быстрый путь доступа по первичному ключу
+        return db.get(Post, post_id)
     finally:
         db.close()
 
 
-def update_schedule_last_run(schedule_id: int):
-    """Обновление времени последнего запуска расписания"""
+@_with_db_session(invalidate_schedule_cache)
+def upsert_active_schedule(db, frequency: str, time_str: str, days_of_week: str = None):
+    """Обновление активного расписания (или создание, если его нет)"""
+    schedule = db.execute(
+        select(Schedule).where(Schedule.is_active.is_(True)).limit(1)
+    ).scalar_one_or_none()
+    if schedule:
+        schedule.frequency = frequency
+        schedule.time = time_str
+        schedule.days_of_week = days_of_week
+    else:
+        schedule = Schedule(
+            frequency=frequency,
+            time=time_str,
+            days_of_week=days_of_week,
+            is_active=True
+        )
+        db.add(schedule)
+    db.flush()
+    return schedule
+
+
+@_with_db_session(invalidate_unpublished_cache)
+def fix_recently_marked_published(db, hours: int = 24):
+    """Снять флаг публикации с недавних постов без telegram_message_id
+
+    Такие посты обычно создавались через /generate, но были ошибочно
+    помечены как опубликованные. Возвращает список исправленных ID.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    posts_to_fix = db.query(Post).filter(
+        Post.is_published.is_(True),
+        Post.telegram_message_id.is_(None),
+        Post.created_at >= cutoff
+    ).all()
+
+    fixed_ids = [post.id for post in posts_to_fix]
+    for post in posts_to_fix:
+        post.is_published = False
+        post.published_at = None
+
+    return fixed_ids
+
+
+def get_active_schedule():
+    """Получение активного расписания (кэшируется на 60 секунд)"""
+    global _schedule_cache
+    now = time.monotonic()
+    if _schedule_cache and now - _schedule_cache[0] < _SCHEDULE_CACHE_TTL:
+        return _schedule_cache[1]
+
     db = SessionLocal()
     try:
-        schedule = db.query(Schedule).filter(Schedule.id == schedule_id).first()
-        if schedule:
-            schedule.last_run = datetime.utcnow()
-            db.commit()
-            return True
-        return False
-    except PermissionError as e:
-        logger.error(f"❌ Ошибка прав доступа при обновлении расписания: {e}")
-        db.rollback()
-        if db_path:
-            try:
-                fix_db_permissions(db_path)
-                db.commit()
-                logger.info("✅ Права исправлены, расписание обновлено")
-                return True
-            except:
-                pass
-        raise
-    except Exception as e:
-        logger.error(f"❌ Ошибка при обновлении расписания: {e}")
-        db.rollback()
-        raise
+        # Используем .is_(True) для правильной работы с Boolean типом в SQLAlchemy;
+        # Core select() обходит слой legacy Query
+        schedule = db.execute(
+            select(Schedule).where(Schedule.is_active.is_(True)).limit(1)
+        ).scalar_one_or_none()
+        _schedule_cache = (now, schedule)
+        return schedule
     finally:
         db.close()
 
+
+@_with_db_session(invalidate_unpublished_cache, invalidate_schedule_cache)
+def finalize_publication(db, post_id: int, message_id: int, schedule_id: int = None):
+    """Отметить пост опубликованным и обновить last_run расписания
+
+    Обе строки обновляются в одной сессии и одном commit - один fsync
+    на публикацию вместо двух отдельных транзакций плюс SELECT
+    расписания между ними.
+    """
+    now = datetime.utcnow()
+    post = db.get(Post, post_id)
+    if post:
+        post.is_published = True
+        post.published_at = now
+        post.telegram_message_id = message_id
+    if schedule_id is not None:
+        schedule = db.get(Schedule, schedule_id)
+        if schedule:
+            schedule.last_run = now
+    return post is not None
+
@@ -1,16 +1,18 @@
 """
 Планировщик для автоматической публикации постов
 """
-from datetime import datetime, time
+from datetime import datetime
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import FSInputFile
 import asyncio
 import logging
+import time
 
 from config import config
-from models import get_active_schedule, update_schedule_last_run, get_unpublished_posts, mark_post_published, add_post
+from models import get_active_schedule, finalize_publication, get_unpublished_posts, add_post
 from generators import generate_complete_post, download_image
 
 # Настройка логирования
@@ -19,6 +21,12 @@ logger = logging.getLogger(__name__)
 # Создаем глобальный планировщик
 scheduler = AsyncIOScheduler(timezone="Europe/Moscow")
 
+# Кэш проверки группы: get_chat - это сетевой round-trip к Telegram
+# (~100-300 мс) на каждую публикацию, а группа меняется крайне редко.
+# Запись вытесняется по TTL или при ошибке "chat not found" при отправке
+_chat_cache = {}
+_CHAT_CACHE_TTL = 6 * 3600.0
+
 
 async def publish_post_to_telegram(bot: Bot, post_data: dict) -> int:
     """
@@ -32,34 +40,36 @@ async def publish_post_to_telegram(bot: Bot, post_data: dict) -> int:
         int: ID отправленного сообщения или None
     """
     try:
-        # Получаем и нормализуем group_id
-        group_id_raw = config.TELEGRAM_GROUP_ID
-        if not group_id_raw:
+        # group_id уже нормализован при импорте конфигурации
+        group_id = config.TELEGRAM_GROUP_ID_NORMALIZED
+        if not group_id:
             logger.error("❌ TELEGRAM_GROUP_ID не установлен в конфигурации!")
             raise ValueError("TELEGRAM_GROUP_ID не установлен")
-        
-        # Преобразуем group_id в правильный формат
-        # Может быть строкой (для супергрупп) или числом
-        if isinstance(group_id_raw, str):
-            # Пытаемся преобразовать в int, если это число
-            try:
-                group_id = int(group_id_raw)
-            except ValueError:
-                # Если не число, оставляем как строку (для супергрупп)
-                group_id = group_id_raw
-        else:
-            group_id = group_id_raw
-        
+
         content = post_data['content']
         
-        logger.info(f"📤 Публикую пост в группу {group_id}")
-        logger.info(f"📝 Длина текста: {len(content)} символов")
-        logger.info(f"🖼️ Изображение: {'Да' if post_data.get('image_url') else 'Нет'}")
+        # Ленивое форматирование (%s) - строки не собираются, если
+        # уровень INFO отключен
+        logger.info("📤 Публикую пост в группу %s", group_id)
+        logger.info("📝 Длина текста: %d символов", len(content))
+        logger.info("🖼️ Изображение: %s", 'Да' if post_data.get('image_url') else 'Нет')
         
+        image_url = post_data.get('image_url')
+        if image_url:
+            image_url = image_url.strip() or None
+
         # Проверяем доступность группы перед публикацией
+        # (результат кэшируется - повторные публикации не тратят
+        # round-trip к API на одну и ту же группу)
+        cached = _chat_cache.get(group_id)
         try:
-            chat = await bot.get_chat(group_id)
-            logger.info(f"✅ Группа доступна: {chat.title} (тип: {chat.type})")
+            if cached and time.monotonic() - cached[0] < _CHAT_CACHE_TTL:
+                chat = cached[1]
+                logger.info("✅ Группа доступна (из кэша): %s (тип: %s)", chat.title, chat.type)
+            else:
+                chat = await bot.get_chat(group_id)
+                _chat_cache[group_id] = (time.monotonic(), chat)
+                logger.info("✅ Группа доступна: %s (тип: %s)", chat.title, chat.type)
         except Exception as e:
             error_msg = str(e).lower()
             logger.error(f"❌ Ошибка доступа к группе {group_id}: {e}")
@@ -80,64 +90,80 @@ async def publish_post_to_telegram(bot: Bot, post_data: dict) -> int:
         
         # Telegram ограничивает caption до 1024 символов
         MAX_CAPTION_LENGTH = 1024
-        
+
         # Если есть изображение
-        image_url = post_data.get('image_url')
-        if image_url and image_url.strip():
-            logger.info(f"🔗 URL изображения: {image_url}")
-            # Скачиваем изображение
-            image_filename = f"post_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-            logger.info(f"💾 Скачиваю изображение: {image_filename}")
-            image_path = download_image(image_url, image_filename)
-            
-            if image_path:
-                logger.info(f"✅ Изображение скачано: {image_path}")
-                photo = FSInputFile(image_path)
-                
-                # Если текст длиннее 1024 символов - публикуем в два сообщения
-                if len(content) > MAX_CAPTION_LENGTH:
-                    # Отправляем изображение с коротким caption
-                    short_caption = content[:MAX_CAPTION_LENGTH-50] + "...\n\n👇 Читать полностью ниже"
-                    logger.info(f"📤 Отправляю изображение с сокращенным текстом...")
+        if image_url:
+            logger.info("🔗 URL изображения: %s", image_url)
+
+            # Если текст длиннее 1024 символов - фото идет с коротким
+            # caption, полный текст отдельным сообщением ниже
+            if len(content) > MAX_CAPTION_LENGTH:
+                caption = content[:MAX_CAPTION_LENGTH-50] + "...\n\n👇 Читать полностью ниже"
+            else:
+                caption = content
+
+            # Сначала отдаем Telegram сам URL - сервер скачает картинку
+            # на своей стороне, без нашего HTTP GET, записи на диск и
+            # повторной загрузки файла. Fallback покрывает только эту
+            # первую отправку: если фото уже ушло, а упало что-то дальше,
+            # повторная отправка дала бы дубль в группе
+            message = None
+            try:
+                logger.info("📤 Отправляю пост с изображением...")
+                message = await bot.send_photo(
+                    chat_id=group_id,
+                    photo=image_url,
+                    caption=caption
+                )
+            except TelegramBadRequest as e:
+                logger.warning("⚠️ Telegram не смог скачать изображение по URL (%s), скачиваю локально", e)
+
+                # Запасной путь: скачиваем файл и отправляем как upload
+                image_filename = f"post_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
+                logger.info("💾 Скачиваю изображение: %s", image_filename)
+                image_path = await download_image(image_url, image_filename)
+
+                if image_path:
+                    logger.info("✅ Изображение скачано: %s", image_path)
                     message = await bot.send_photo(
                         chat_id=group_id,
-                        photo=photo,
-                        caption=short_caption
+                        photo=FSInputFile(image_path),
+                        caption=caption
                     )
+                else:
+                    logger.warning("⚠️ Не удалось скачать изображение, публикую без него")
+
+            if message:
+                if len(content) > MAX_CAPTION_LENGTH:
                     # Отправляем полный текст отдельным сообщением
-                    logger.info(f"📤 Отправляю полный текст отдельным сообщением...")
+                    logger.info("📤 Отправляю полный текст отдельным сообщением...")
                     await bot.send_message(
                         chat_id=group_id,
                         text=content
                     )
-                    logger.info(f"✅ Пост опубликован с изображением в двух сообщениях (ID: {message.message_id})")
+                    logger.info("✅ Пост опубликован с изображением в двух сообщениях (ID: %s)", message.message_id)
                 else:
-                    # Отправляем пост с изображением и полным текстом
-                    logger.info(f"📤 Отправляю пост с изображением и текстом...")
-                    message = await bot.send_photo(
-                        chat_id=group_id,
-                        photo=photo,
-                        caption=content
-                    )
-                    logger.info(f"✅ Пост опубликован с изображением (ID: {message.message_id})")
-                
+                    logger.info("✅ Пост опубликован с изображением (ID: %s)", message.message_id)
                 return message.message_id
-            else:
-                logger.warning(f"⚠️ Не удалось скачать изображение, публикую без него")
-        
+
+
         # Если изображения нет или не удалось скачать
-        logger.info(f"📤 Отправляю текстовый пост без изображения...")
+        logger.info("📤 Отправляю текстовый пост без изображения...")
         message = await bot.send_message(
             chat_id=group_id,
             text=content
         )
-        logger.info(f"✅ Пост опубликован без изображения (ID: {message.message_id})")
+        logger.info("✅ Пост опубликован без изображения (ID: %s)", message.message_id)
         return message.message_id
         
     except ValueError as e:
         logger.error(f"❌ Ошибка валидации: {e}")
         raise
     except Exception as e:
+        # Если группа пропала после кэшированной проверки - вытесняем
+        # запись, чтобы следующая публикация перепроверила группу
+        if "chat not found" in str(e).lower():
+            _chat_cache.pop(group_id, None)
         logger.error(f"❌ Ошибка публикации поста: {e}")
         logger.error(f"Тип ошибки: {type(e).__name__}")
         import traceback
@@ -145,21 +171,26 @@ async def publish_post_to_telegram(bot: Bot, post_data: dict) -> int:
         return None
 
 
-async def scheduled_post_job(bot: Bot):
+async def scheduled_post_job(bot: Bot, schedule_id: int = None):
     """
     Задача для планировщика: генерация и публикация нового поста
-    
+
     Args:
         bot: Экземпляр Telegram бота
+        schedule_id: ID расписания, создавшего задачу (известен при
+            настройке триггера - не перечитываем расписание из БД)
     """
-    logger.info(f"\n{'='*60}")
-    logger.info(f"🕐 Запуск запланированной публикации: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    logger.info(f"{'='*60}\n")
+    logger.info("\n%s", '='*60)
+    logger.info("🕐 Запуск запланированной публикации: %s",
+                datetime.now().isoformat(sep=' ', timespec='seconds'))
+    logger.info("%s\n", '='*60)
     
     try:
-        # Проверяем, есть ли неопубликованные посты
-        unpublished = get_unpublished_posts()
-        
+        # Блокирующие вызовы OpenAI и БД уводим в поток, чтобы event loop
+        # бота оставался свободным на время работы задачи
+        # Нужен только самый свежий неопубликованный пост - limit=1
+        unpublished = await asyncio.to_thread(get_unpublished_posts, 1)
+
         if unpublished:
             # Используем последний созданный пост (первый в отсортированном списке)
             post = unpublished[0]
@@ -167,36 +198,32 @@ async def scheduled_post_job(bot: Bot):
                 'content': post.content,
                 'image_url': post.image_url if post.image_url else None
             }
-            logger.info(f"📄 Используем существующий пост ID: {post.id}, тема: {post.topic}")
-            logger.info(f"   Создан: {post.created_at}")
-            logger.info(f"   Изображение: {'Есть' if post.image_url else 'Нет'}")
+            logger.info("📄 Используем существующий пост ID: %s, тема: %s", post.id, post.topic)
+            logger.info("   Создан: %s", post.created_at)
+            logger.info("   Изображение: %s", 'Есть' if post.image_url else 'Нет')
         else:
             # Генерируем новый пост
             logger.info("🔄 Генерируем новый пост...")
-            post_data = generate_complete_post()
-            
+            post_data = await asyncio.to_thread(generate_complete_post)
+
             # Сохраняем в базу данных
-            from models import add_post
-            post = add_post(
+            post = await asyncio.to_thread(
+                add_post,
                 topic=post_data['topic'],
                 content=post_data['content'],
                 image_url=post_data['image_url'],
                 image_prompt=post_data['image_prompt']
             )
-            logger.info(f"💾 Пост сохранен в БД с ID: {post.id}")
+            logger.info("💾 Пост сохранен в БД с ID: %s", post.id)
         
         # Публикуем пост
         message_id = await publish_post_to_telegram(bot, post_data)
         
         if message_id:
-            # Отмечаем пост как опубликованный
-            mark_post_published(post.id, message_id)
-            logger.info(f"✅ Пост успешно опубликован и отмечен в БД")
-            
-            # Обновляем время последнего запуска расписания
-            schedule = get_active_schedule()
-            if schedule:
-                update_schedule_last_run(schedule.id)
+            # Отмечаем пост опубликованным и обновляем last_run
+            # расписания одной транзакцией
+            await asyncio.to_thread(finalize_publication, post.id, message_id, schedule_id)
+            logger.info("✅ Пост успешно опубликован и отмечен в БД")
         
     except Exception as e:
         logger.error(f"❌ Ошибка в задаче планировщика: {e}")
@@ -253,7 +280,7 @@ def setup_scheduler(bot: Bot):
         scheduler.add_job(
             scheduled_post_job,
             trigger=trigger,
-            args=[bot],
+            args=[bot, schedule.id],
             id='post_publication',
             replace_existing=True,
             misfire_grace_time=3600  # 1 час на случай пропуска
@@ -0,0 +1,37 @@
+"""
+Общее in-process состояние для бота и API сервера
+
+Бот и API работают в одном процессе (см. run_both в api_server.py),
+поэтому передача темы для Make.com идет через asyncio.Queue,
+а не через файл на диске.
+"""
+import asyncio
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Одноместная очередь: храним только последнюю запрошенную тему
+make_topic_queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+
+def set_make_topic(topic: str):
+    """Сохранить тему для Make.com (заменяет предыдущую, если она не забрана)"""
+    # Очередь одноместная: убираем старую тему, если Make ее не забрал
+    try:
+        make_topic_queue.get_nowait()
+    except asyncio.QueueEmpty:
+        pass
+    make_topic_queue.put_nowait({
+        "topic": topic,
+        "requested_at": datetime.now().isoformat()
+    })
+    logger.info(f"📌 Тема для Make сохранена: {topic}")
+
+
+def pop_make_topic():
+    """Забрать тему для Make.com (одноразово) или None, если тема не задана"""
+    try:
+        return make_topic_queue.get_nowait()
+    except asyncio.QueueEmpty:
+        return None